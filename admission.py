@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # no flock() on Windows; slots are then counted per process
+    fcntl = None
+
+# How often a request waiting for a slot checks whether another process has
+# released one. Slots released in the same process wake waiters at once.
+POLL_INTERVAL = 0.05
+
+
+class Overloaded(Exception):
+    """Raised when a request is refused a slot."""
+
+
+class AdmissionControl:
+    """
+    Limits how many requests run a costly stage at once. Up to `slots`
+    requests run; up to `queue` more wait for a slot, each for at most
+    `timeout` seconds. Requests beyond that, or that time out, are refused
+    with Overloaded rather than left to slow everyone down. With slots set
+    to 0 every request is admitted at once.
+
+    With a `directory`, the slots are shared by every worker process that
+    uses it: each slot is a lock file there, held with flock() while a
+    request runs, so the kernel frees it even if its worker is killed. The
+    queue is still counted per process. Without a directory, or without
+    flock(), slots are counted per process too.
+    """
+
+    def __init__(self, slots, queue=16, timeout=10.0, directory=None):
+        self.slots = slots
+        self.queue = queue
+        self.timeout = timeout
+        self.directory = directory if fcntl is not None else None
+        if self.directory and slots:
+            os.makedirs(self.directory, exist_ok=True)
+        self._condition = threading.Condition()
+        self._held = {}
+        self._waiting = 0
+        self._admitted = 0
+        self._rejected = {'queue_full': 0, 'timeout': 0}
+
+    def acquire(self):
+        """Wait for a slot and return it for release(); None if there is no limit."""
+        if not self.slots:
+            return None
+        with self._condition:
+            slot = None if self._waiting else self._take()
+            if slot is None:
+                if self._waiting >= self.queue:
+                    self._rejected['queue_full'] += 1
+                    raise Overloaded("Too many uploads are being processed; try again shortly.")
+                self._waiting += 1
+                try:
+                    deadline = time.monotonic() + self.timeout
+                    while slot is None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._rejected['timeout'] += 1
+                            raise Overloaded(f"No upload slot came free within {self.timeout:g} seconds; "
+                                             f"try again shortly.")
+                        self._condition.wait(min(remaining, POLL_INTERVAL) if self.directory else remaining)
+                        slot = self._take()
+                finally:
+                    self._waiting -= 1
+            self._admitted += 1
+            return slot
+
+    def _take(self):
+        for slot in range(self.slots):
+            if slot in self._held:
+                continue
+            lock_file = None
+            if self.directory:
+                lock_file = open(os.path.join(self.directory, f'slot-{slot}.lock'), 'a')
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    lock_file.close()
+                    continue
+            self._held[slot] = lock_file
+            return slot
+        return None
+
+    def release(self, slot):
+        if slot is None:
+            return
+        with self._condition:
+            lock_file = self._held.pop(slot)
+            if lock_file is not None:
+                # Closing the file drops its lock.
+                lock_file.close()
+            self._condition.notify()
+
+    def stats(self):
+        with self._condition:
+            return {
+                'slots': self.slots,
+                'shared': bool(self.directory),
+                'queue': self.queue,
+                'active': len(self._held),
+                'waiting': self._waiting,
+                'admitted': self._admitted,
+                'rejected': dict(self._rejected),
+            }
+
+    def render(self):
+        """The stats in the Prometheus text format, for /metrics."""
+        stats = self.stats()
+        lines = [
+            '# HELP intellinet_extract_active Requests of this worker extracting right now.',
+            '# TYPE intellinet_extract_active gauge',
+            f"intellinet_extract_active {stats['active']}",
+            '# HELP intellinet_extract_waiting Requests of this worker waiting for an extraction slot.',
+            '# TYPE intellinet_extract_waiting gauge',
+            f"intellinet_extract_waiting {stats['waiting']}",
+            '# HELP intellinet_extract_admitted_total Requests given an extraction slot.',
+            '# TYPE intellinet_extract_admitted_total counter',
+            f"intellinet_extract_admitted_total {stats['admitted']}",
+            '# HELP intellinet_extract_rejected_total Requests refused an extraction slot, by reason.',
+            '# TYPE intellinet_extract_rejected_total counter',
+        ]
+        for reason, count in stats['rejected'].items():
+            lines.append(f'intellinet_extract_rejected_total{{reason="{reason}"}} {count}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,77 @@
+import zipfile
+
+from extractor import id_insertions
+
+# Pages are copied to the archive in pieces of at most this many bytes, and
+# compressed output is handed on once this much of it has built up.
+PIECE_SIZE = 1024 * 1024
+
+
+def annotate(html_content):
+    """
+    Yield html_content in pieces, with an id attribute inserted after the
+    tag name of every element that had none, carrying the id extraction
+    gives that element. All other bytes are passed through unchanged.
+    """
+    encoding, insertions = id_insertions(html_content)
+    with memoryview(html_content) as view:
+        previous = 0
+        for offset, element_id in insertions + [(len(view), None)]:
+            for start in range(previous, offset, PIECE_SIZE):
+                yield bytes(view[start:min(start + PIECE_SIZE, offset)])
+            if element_id is not None:
+                yield f' id="{element_id}"'.encode(encoding)
+            previous = offset
+
+
+def safe_name(name):
+    """Return name as a relative path that cannot leave the folder it is unpacked in."""
+    parts = [part for part in name.replace('\\', '/').split('/') if part not in ('', '.', '..')]
+    return '/'.join(parts) or 'page.html'
+
+
+class _Sink:
+    """Write-only file object that collects what ZipFile writes to it."""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.pending = 0
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        self.pending += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        self.pending = 0
+        return data
+
+
+def stream_annotated(pages):
+    """
+    Yield a zip archive of the annotated copies of pages, an iterable of
+    (filename, html_content), as it is written. The sink cannot seek, so
+    ZipFile writes each member's sizes after its data and nothing but the
+    page being annotated is held in memory.
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for filename, html_content in pages:
+            force_zip64 = len(html_content) > zipfile.ZIP64_LIMIT // 2
+            with archive.open(safe_name(filename), 'w', force_zip64=force_zip64) as member:
+                for piece in annotate(html_content):
+                    member.write(piece)
+                    if sink.pending >= PIECE_SIZE:
+                        yield sink.take()
+            yield sink.take()
+    yield sink.take()
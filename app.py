@@ -1,11 +1,512 @@
-from flask import Flask, request, render_template_string, session, redirect, url_for
-from bs4 import BeautifulSoup
+from flask import Flask, Request, request, render_template, session, redirect, url_for, jsonify, send_file, abort, Response, stream_with_context, g
+from jinja2 import DictLoader, FileSystemBytecodeCache
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+import io
+import tempfile
+from admission import AdmissionControl, Overloaded
+from annotate import stream_annotated
+from archive import ArchiveError, check_archive, is_archive, is_html, iter_archive
+from bundle import BundleStore
+from cache import ExtractionCache
+from extractor import empty_elements_data, extract_each, share_elements, build_id_index, count_elements, open_upload, TooManyElements
+from jobs import JobError, JobQueue
+from metrics import Metrics
+from profiling import Profiler
+from search import ElementIndex
+from store import ArtifactStore, create_store, load_secret_key
+from jsgen import RUNTIME, embed_command_table, generate_command_table, generate_js_code
 import os
-import uuid
+import gzip
+import hashlib
+import hmac
 import json
+import random
+import shutil
+import threading
+import time
+
+
+
+class UploadRequest(Request):
+    """
+    Keeps small uploads in memory and spools larger ones to an unnamed
+    temporary file, which open_upload() then memory-maps for parsing.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is not None and total_content_length <= app.config['UPLOAD_SPOOL_BYTES']:
+            return io.BytesIO()
+        return tempfile.TemporaryFile('w+b')
+
 
 app = Flask(__name__)
-app.secret_key = os.urandom(24)
+app.request_class = UploadRequest
+
+# Upload limits. Requests larger than MAX_CONTENT_LENGTH and files larger than
+# MAX_FILE_BYTES get a 413; uploads yielding more than MAX_ELEMENTS elements
+# get a 422. Request bodies above UPLOAD_SPOOL_BYTES are spooled to disk.
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('INTELLINET_MAX_UPLOAD_BYTES', str(256 * 1024 * 1024)))
+app.config['MAX_FILE_BYTES'] = int(os.environ.get('INTELLINET_MAX_FILE_BYTES', str(64 * 1024 * 1024)))
+app.config['MAX_ELEMENTS'] = int(os.environ.get('INTELLINET_MAX_ELEMENTS', '100000'))
+app.config['UPLOAD_SPOOL_BYTES'] = int(os.environ.get('INTELLINET_UPLOAD_SPOOL_BYTES', str(512 * 1024)))
+
+# .zip and .tar.gz uploads are read one member at a time. Each HTML member is
+# held to MAX_FILE_BYTES, and an archive may hold at most MAX_ARCHIVE_MEMBERS
+# HTML files adding up to MAX_ARCHIVE_BYTES.
+app.config['MAX_ARCHIVE_MEMBERS'] = int(os.environ.get('INTELLINET_MAX_ARCHIVE_MEMBERS', '10000'))
+app.config['MAX_ARCHIVE_BYTES'] = int(os.environ.get('INTELLINET_MAX_ARCHIVE_BYTES', str(1024 * 1024 * 1024)))
+
+# Every worker must sign cookies with the same key. INTELLINET_SECRET_KEY wins;
+# otherwise a key is generated once and kept in the instance folder.
+app.config['SECRET_KEY_FILE'] = os.environ.get('INTELLINET_SECRET_KEY_FILE', os.path.join(app.instance_path, 'secret_key'))
+app.secret_key = os.environ.get('INTELLINET_SECRET_KEY') or load_secret_key(app.config['SECRET_KEY_FILE'])
+
+# Extracted elements are kept server-side; the session cookie only carries an
+# opaque key. 'sqlite' is shared by all workers, 'memory' suits a single one.
+app.config['SESSION_BACKEND'] = os.environ.get('INTELLINET_SESSION_BACKEND', 'sqlite')
+app.config['SESSION_DB'] = os.environ.get('INTELLINET_SESSION_DB', os.path.join(app.instance_path, 'sessions.sqlite3'))
+app.config['SESSION_TTL'] = int(os.environ.get('INTELLINET_SESSION_TTL', '3600'))
+
+session_store = create_store(app.config['SESSION_BACKEND'], app.config['SESSION_DB'], app.config['SESSION_TTL'])
+
+# Each /generate call writes its manifest and script under its own job id.
+# Jobs older than ARTIFACT_TTL seconds are removed and at most
+# ARTIFACT_MAX_JOBS are kept.
+app.config['ARTIFACT_DIR'] = os.environ.get('INTELLINET_ARTIFACT_DIR', os.path.join(app.instance_path, 'artifacts'))
+app.config['ARTIFACT_TTL'] = int(os.environ.get('INTELLINET_ARTIFACT_TTL', str(24 * 3600)))
+app.config['ARTIFACT_MAX_JOBS'] = int(os.environ.get('INTELLINET_ARTIFACT_MAX_JOBS', '1000'))
+
+artifact_store = ArtifactStore(app.config['ARTIFACT_DIR'], app.config['ARTIFACT_TTL'], app.config['ARTIFACT_MAX_JOBS'])
+
+# Minified, precompressed scripts served from /bundle/<hash>.js and command
+# tables served from /commands/<hash>.json. Both are immutable and shared by
+# every job that generates the same content. The runtime is the same for
+# every site, so it is published once at startup.
+app.config['BUNDLE_DIR'] = os.environ.get('INTELLINET_BUNDLE_DIR', os.path.join(app.instance_path, 'bundles'))
+
+bundle_store = BundleStore(app.config['BUNDLE_DIR'])
+runtime_hash = bundle_store.publish(RUNTIME)
+
+# 'stream' extracts in a single event-driven pass, 'soup' builds a full
+# BeautifulSoup tree and walks it with find_all.
+app.config['EXTRACTOR_MODE'] = os.environ.get('INTELLINET_EXTRACTOR_MODE', 'stream')
+
+# Number of processes used to parse multi-file uploads; 0 or 1 parses in the
+# request thread. Uploads smaller than PARALLEL_MIN_BYTES are always parsed
+# in-process.
+app.config['PARSE_WORKERS'] = int(os.environ.get('INTELLINET_PARSE_WORKERS', '0'))
+app.config['PARALLEL_MIN_BYTES'] = int(os.environ.get('INTELLINET_PARALLEL_MIN_BYTES', str(512 * 1024)))
+
+# Extraction results are cached by content hash. EXTRACTION_CACHE_BYTES bounds
+# the in-memory tier (0 disables the cache); EXTRACTION_CACHE_DIR adds a disk
+# tier that all workers share.
+app.config['EXTRACTION_CACHE_BYTES'] = int(os.environ.get('INTELLINET_EXTRACTION_CACHE_BYTES', str(64 * 1024 * 1024)))
+app.config['EXTRACTION_CACHE_DIR'] = os.environ.get('INTELLINET_EXTRACTION_CACHE_DIR')
+
+extraction_cache = None
+if app.config['EXTRACTION_CACHE_BYTES'] > 0:
+    extraction_cache = ExtractionCache(app.config['EXTRACTION_CACHE_BYTES'], app.config['EXTRACTION_CACHE_DIR'])
+
+# Uploads that name a site are compared against that site's previous upload:
+# unchanged files are not parsed again and earlier command names and
+# selections are offered again. Sites are forgotten after SITE_TTL seconds.
+app.config['SITE_BACKEND'] = os.environ.get('INTELLINET_SITE_BACKEND', 'sqlite')
+app.config['SITE_DB'] = os.environ.get('INTELLINET_SITE_DB', os.path.join(app.instance_path, 'sites.sqlite3'))
+app.config['SITE_TTL'] = int(os.environ.get('INTELLINET_SITE_TTL', str(30 * 24 * 3600)))
+
+site_store = create_store(app.config['SITE_BACKEND'], app.config['SITE_DB'], app.config['SITE_TTL'])
+
+# With ASYNC_UPLOADS, or when a client sends "Prefer: respond-async", /process
+# saves the files under UPLOAD_DIR and parses them in the background, in at
+# most UPLOAD_WORKERS threads per process. Further uploads are refused with a
+# 503 while UPLOAD_QUEUE_SIZE jobs are queued or running. Job progress is kept
+# for JOB_TTL seconds in the same kind of store as sessions.
+app.config['ASYNC_UPLOADS'] = os.environ.get('INTELLINET_ASYNC_UPLOADS', '0') == '1'
+app.config['UPLOAD_DIR'] = os.environ.get('INTELLINET_UPLOAD_DIR', os.path.join(app.instance_path, 'uploads'))
+app.config['UPLOAD_WORKERS'] = int(os.environ.get('INTELLINET_UPLOAD_WORKERS', '2'))
+app.config['UPLOAD_QUEUE_SIZE'] = int(os.environ.get('INTELLINET_UPLOAD_QUEUE_SIZE', '16'))
+app.config['JOB_DB'] = os.environ.get('INTELLINET_JOB_DB', os.path.join(app.instance_path, 'jobs.sqlite3'))
+app.config['JOB_TTL'] = int(os.environ.get('INTELLINET_JOB_TTL', '3600'))
+# A progress page's event stream is closed after JOB_EVENTS_SECONDS and the
+# browser reconnects, so a long job never holds a request open for longer
+# than a sync worker's timeout allows.
+app.config['JOB_EVENTS_SECONDS'] = float(os.environ.get('INTELLINET_JOB_EVENTS_SECONDS', '15'))
+
+os.makedirs(app.config['UPLOAD_DIR'], exist_ok=True)
+upload_jobs = JobQueue(
+    create_store(app.config['SESSION_BACKEND'], app.config['JOB_DB'], app.config['JOB_TTL']),
+    app.config['UPLOAD_WORKERS'],
+    app.config['UPLOAD_QUEUE_SIZE']
+)
+
+
+# Per-stage timers exported on /metrics and in Server-Timing headers. Each
+# worker process keeps its own figures.
+app.config['METRICS_ENABLED'] = os.environ.get('INTELLINET_METRICS', '0') == '1'
+
+metrics = Metrics(app.config['METRICS_ENABLED'])
+
+
+# Request profiling, off unless INTELLINET_PROFILE_TOKEN is set. Requests
+# carrying the token in an X-Profile-Token header run under cProfile and
+# tracemalloc, as does a PROFILE_SAMPLE_RATE fraction of all others. The
+# newest PROFILE_KEEP profiles are listed on /debug/profiles, which also
+# needs the token.
+app.config['PROFILE_TOKEN'] = os.environ.get('INTELLINET_PROFILE_TOKEN')
+app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('INTELLINET_PROFILE_SAMPLE_RATE', '0'))
+app.config['PROFILE_DIR'] = os.environ.get('INTELLINET_PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+app.config['PROFILE_KEEP'] = int(os.environ.get('INTELLINET_PROFILE_KEEP', '50'))
+
+profiler = Profiler(app.config['PROFILE_DIR'], app.config['PROFILE_KEEP']) if app.config['PROFILE_TOKEN'] else None
+
+
+# Admission control for extraction. At most EXTRACT_SLOTS requests parse at
+# once (0 for no limit), counted across every worker process through lock
+# files in EXTRACT_SLOT_DIR; up to EXTRACT_QUEUE more per process wait, each
+# for at most EXTRACT_QUEUE_TIMEOUT seconds, and the rest are answered at
+# once with a 503 and a Retry-After of RETRY_AFTER seconds. A single request
+# may parse at most EXTRACT_REQUEST_BYTES of HTML, archive contents included.
+app.config['EXTRACT_SLOTS'] = int(os.environ.get('INTELLINET_EXTRACT_SLOTS', str(os.cpu_count() or 1)))
+app.config['EXTRACT_SLOT_DIR'] = os.environ.get('INTELLINET_EXTRACT_SLOT_DIR', os.path.join(app.instance_path, 'extract_slots'))
+app.config['EXTRACT_QUEUE'] = int(os.environ.get('INTELLINET_EXTRACT_QUEUE', '16'))
+app.config['EXTRACT_QUEUE_TIMEOUT'] = float(os.environ.get('INTELLINET_EXTRACT_QUEUE_TIMEOUT', '10'))
+app.config['EXTRACT_REQUEST_BYTES'] = int(os.environ.get('INTELLINET_EXTRACT_REQUEST_BYTES', str(512 * 1024 * 1024)))
+app.config['RETRY_AFTER'] = int(os.environ.get('INTELLINET_RETRY_AFTER', '5'))
+
+admission = AdmissionControl(app.config['EXTRACT_SLOTS'], app.config['EXTRACT_QUEUE'],
+                             app.config['EXTRACT_QUEUE_TIMEOUT'], app.config['EXTRACT_SLOT_DIR'])
+
+
+# Recently used uploads and their search indexes are kept in memory, so
+# paging through the selection does not reload the upload for every page.
+# SELECT_PAGE_LIMIT caps the elements returned per page.
+app.config['UPLOAD_CACHE_ENTRIES'] = int(os.environ.get('INTELLINET_UPLOAD_CACHE_ENTRIES', '16'))
+app.config['SELECT_PAGE_LIMIT'] = int(os.environ.get('INTELLINET_SELECT_PAGE_LIMIT', '500'))
+
+upload_cache = OrderedDict()
+upload_cache_lock = threading.Lock()
+
+
+def use_upload(elements_key):
+    # Every upload is stored under a new key, so a key always names the same
+    # data and upload_cache never holds a stale copy.
+    previous_key = session.get('elements_key')
+    session['elements_key'] = elements_key
+    if previous_key and previous_key != elements_key:
+        session_store.delete(previous_key)
+
+
+def save_upload(upload):
+    use_upload(session_store.save(upload))
+
+
+def load_upload():
+    """
+    Return the stored upload: its elements_data, the id_index used to
+    resolve selections and any ids that were found in more than one file.
+    """
+    return load_upload_index()[0]
+
+
+def load_upload_index():
+    """Return the stored upload and an ElementIndex over its elements."""
+    elements_key = session.get('elements_key')
+    with upload_cache_lock:
+        cached = upload_cache.get(elements_key)
+        if cached is not None:
+            upload_cache.move_to_end(elements_key)
+            return cached
+
+    upload = session_store.load(elements_key) if elements_key else None
+    if upload is None:
+        upload = {'elements_data': empty_elements_data(), 'id_index': {}, 'duplicate_ids': {}}
+        return upload, ElementIndex(upload['elements_data'])
+
+    cached = (upload, ElementIndex(upload['elements_data']))
+    with upload_cache_lock:
+        upload_cache[elements_key] = cached
+        while len(upload_cache) > app.config['UPLOAD_CACHE_ENTRIES']:
+            upload_cache.popitem(last=False)
+    return cached
+
+
+def load_site_pages(site):
+    """Return the elements_data of each page of the site's last upload, by cache key."""
+    pages = site_store.load(f'pages/{site}') if site else None
+    return pages or {}
+
+
+def load_site_choices(site):
+    """
+    Return the names and selection last used to generate the site's script.
+    They are kept apart from its pages, which are far larger and only read
+    while an upload is extracted.
+    """
+    choices = site_store.load(f'names/{site}') if site else None
+    return choices or {'names': {}, 'selected': []}
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def check_upload_filename(filename):
+    if not (is_html(filename) or is_archive(filename)):
+        raise UploadError("Invalid file type. Only HTML files (.html, .htm) and .zip or .tar.gz archives are allowed.", 400)
+
+
+@contextmanager
+def extraction_slot():
+    """Hold an extraction slot, or raise a 503 UploadError if none comes free."""
+    try:
+        slot = admission.acquire()
+    except Overloaded as e:
+        raise UploadError(str(e), 503)
+    try:
+        yield
+    finally:
+        admission.release(slot)
+
+
+def iter_pages(files, uploads):
+    """
+    Yield (filename, html_content) for every uploaded HTML file and every
+    HTML file inside an uploaded archive, up to EXTRACT_REQUEST_BYTES of
+    them in all.
+    """
+    total = 0
+    for filename, html_content in read_pages(files, uploads):
+        total += len(html_content)
+        if total > app.config['EXTRACT_REQUEST_BYTES']:
+            raise UploadError(f"The upload holds more than {app.config['EXTRACT_REQUEST_BYTES']} bytes of HTML.", 413)
+        yield filename, html_content
+
+
+def check_pages(files):
+    """
+    Check what iter_pages() would refuse before any of it is read: the size
+    of every HTML file and the central directory of every zip archive.
+    Raises the UploadError iter_pages() would.
+    """
+    total = 0
+    for filename, stream in files:
+        if is_archive(filename):
+            try:
+                total += check_archive(stream, filename, app.config['MAX_FILE_BYTES'],
+                                       app.config['MAX_ARCHIVE_MEMBERS'], app.config['MAX_ARCHIVE_BYTES'])
+            except ArchiveError as e:
+                raise UploadError(str(e), e.status)
+        else:
+            size = stream.seek(0, os.SEEK_END)
+            stream.seek(0)
+            if size > app.config['MAX_FILE_BYTES']:
+                raise UploadError(f"{filename} is larger than {app.config['MAX_FILE_BYTES']} bytes.", 413)
+            total += size
+        if total > app.config['EXTRACT_REQUEST_BYTES']:
+            raise UploadError(f"The upload holds more than {app.config['EXTRACT_REQUEST_BYTES']} bytes of HTML.", 413)
+
+
+def read_pages(files, uploads):
+    """
+    Yield the pages of iter_pages(). `files` holds (filename, file object)
+    pairs. HTML files are exposed with open_upload(), registered on the
+    `uploads` ExitStack; archive members are read one at a time.
+    """
+    for filename, stream in files:
+        if not is_archive(filename):
+            with metrics.stage('read'):
+                html_content = uploads.enter_context(open_upload(stream))
+            if len(html_content) > app.config['MAX_FILE_BYTES']:
+                raise UploadError(f"{filename} is larger than {app.config['MAX_FILE_BYTES']} bytes.", 413)
+            yield filename, html_content
+            continue
+
+        members = iter_archive(stream, filename, app.config['MAX_FILE_BYTES'],
+                               app.config['MAX_ARCHIVE_MEMBERS'], app.config['MAX_ARCHIVE_BYTES'])
+        while True:
+            try:
+                with metrics.stage('read'):
+                    member = next(members, None)
+            except ArchiveError as e:
+                raise UploadError(str(e), e.status)
+            if member is None:
+                break
+            name, html_content = member
+            yield f"{filename}/{name}", html_content
+
+
+def page_batches(files, uploads, progress=None):
+    """
+    Group the pages of an upload into the batches build_upload() extracts
+    at once. Plain uploads are already on hand and form a single batch, so
+    the parse pool can spread all of them; archives, and uploads whose
+    progress is reported, go a few pages at a time, which bounds the memory
+    held by decompressed members.
+    """
+    pages = iter_pages(files, uploads)
+    if progress is None and not any(is_archive(filename) for filename, _ in files):
+        return [list(pages)]
+    return batched(pages, max(app.config['PARSE_WORKERS'], 1))
+
+
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def run_extraction(html_contents, keys=None, previous=None):
+    with metrics.stage('extract'):
+        results = extract_each(
+            html_contents,
+            mode=app.config['EXTRACTOR_MODE'],
+            workers=app.config['PARSE_WORKERS'],
+            min_parallel_bytes=app.config['PARALLEL_MIN_BYTES'],
+            cache=extraction_cache,
+            max_elements=app.config['MAX_ELEMENTS'],
+            keys=keys,
+            previous=previous
+        )
+    if metrics.enabled:
+        metrics.count(
+            files=len(html_contents),
+            bytes=sum(len(html_content) for html_content in html_contents),
+            elements=sum(count_elements(result) for result in results)
+        )
+    return results
+
+
+def name_duplicates(duplicates, filenames):
+    """Replace the document positions in build_id_index's duplicates with filenames."""
+    duplicate_ids = {}
+    for element_id, documents in duplicates.items():
+        duplicate_ids[element_id] = [filenames[document] for document in documents]
+    if duplicate_ids:
+        examples = '; '.join(f"{element_id!r} in {files[0]} and {len(files) - 1} more"
+                             for element_id, files in list(duplicate_ids.items())[:3])
+        app.logger.warning(f"{len(duplicate_ids)} ids found in more than one file, e.g. {examples}")
+    return duplicate_ids
+
+
+def build_upload(batches, site, progress=None):
+    """
+    Extract the pages of an upload, given as batches of (filename,
+    html_content) pairs, and return the record /select-components reads.
+    Pages whose content is unchanged since the site's last upload reuse
+    that extraction.
+
+    With a progress callback, progress(parsed=..., elements=...) is called
+    after each batch.
+    """
+    mode = app.config['EXTRACTOR_MODE']
+    site_pages = load_site_pages(site)
+    filenames = []
+    keys = []
+    results = []
+    elements = 0
+    for batch in batches:
+        html_contents = [html_content for _, html_content in batch]
+        batch_keys = [ExtractionCache.key(html_content, mode) for html_content in html_contents] if site else None
+        previous = [site_pages.get(key) for key in batch_keys] if site else None
+        batch_results = run_extraction(html_contents, batch_keys, previous)
+
+        filenames.extend(filename for filename, _ in batch)
+        keys.extend(batch_keys or [])
+        results.extend(batch_results)
+        elements += sum(count_elements(result) for result in batch_results)
+        if elements > app.config['MAX_ELEMENTS']:
+            raise TooManyElements(f"More than {app.config['MAX_ELEMENTS']} elements found in one upload.")
+        if progress is not None:
+            progress(parsed=len(results), elements=elements)
+
+    if not results:
+        raise UploadError("No HTML files found in the upload.", 400)
+
+    # Elements repeated across pages, such as a shared navbar, are kept
+    # once; 'pages' lists the positions each page's elements are at.
+    with metrics.stage('index'):
+        elements_data, pages = share_elements(results)
+        id_index, duplicates = build_id_index(elements_data, pages)
+    duplicate_ids = name_duplicates(duplicates, filenames)
+
+    if site:
+        site_store.save(dict(zip(keys, results)), f'pages/{site}')
+    return {'elements_data': elements_data, 'id_index': id_index, 'duplicate_ids': duplicate_ids, 'site': site,
+            'files': filenames, 'pages': pages}
+
+
+def process_job(progress, job_dir, filenames, site):
+    """Background half of an asynchronous /process: parse the saved files."""
+    try:
+        with extraction_slot(), ExitStack() as uploads:
+            files = [
+                (filename, uploads.enter_context(open(os.path.join(job_dir, str(position)), 'rb')))
+                for position, filename in enumerate(filenames)
+            ]
+            upload = build_upload(page_batches(files, uploads, progress), site, progress)
+        return {'upload_key': session_store.save(upload)}
+    except UploadError as e:
+        raise JobError(str(e), e.status)
+    except TooManyElements as e:
+        raise JobError(f"{e} The limit is {app.config['MAX_ELEMENTS']}; split the upload into smaller batches.", 422)
+    finally:
+        shutil.rmtree(job_dir, ignore_errors=True)
+
+
+def wants_async():
+    return app.config['ASYNC_UPLOADS'] or 'respond-async' in request.headers.get('Prefer', '')
+
+
+def start_upload_job(uploaded_files, site):
+    """
+    Save the uploaded files and queue them for parsing. Returns the
+    response to send: where to follow the job's progress.
+    """
+    filenames = [uploaded_file.filename for uploaded_file in uploaded_files]
+    for filename in filenames:
+        check_upload_filename(filename)
+    if upload_jobs.active() >= upload_jobs.max_jobs:
+        raise UploadError("Too many uploads are being processed. Please try again shortly.", 503)
+
+    job_dir = tempfile.mkdtemp(dir=app.config['UPLOAD_DIR'])
+    try:
+        with metrics.stage('read'):
+            for position, uploaded_file in enumerate(uploaded_files):
+                path = os.path.join(job_dir, str(position))
+                uploaded_file.save(path)
+                if not is_archive(uploaded_file.filename) and os.path.getsize(path) > app.config['MAX_FILE_BYTES']:
+                    raise UploadError(f"{uploaded_file.filename} is larger than {app.config['MAX_FILE_BYTES']} bytes.", 413)
+        # The number of pages in an archive is only known once it is read.
+        total = None if any(is_archive(filename) for filename in filenames) else len(filenames)
+        job_id = upload_jobs.submit(process_job, job_dir, filenames, site,
+                                    status={'files': total, 'parsed': 0, 'elements': 0})
+        if job_id is None:
+            raise UploadError("Too many uploads are being processed. Please try again shortly.", 503)
+    except BaseException:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        raise
+
+    urls = {
+        'job_id': job_id,
+        'status': url_for('upload_job_status', job_id=job_id),
+        'events': url_for('upload_job_events', job_id=job_id),
+        'select': url_for('upload_job_select', job_id=job_id),
+    }
+    if request.accept_mimetypes.best == 'application/json':
+        response = jsonify(urls)
+        response.status_code = 202
+        response.headers['Location'] = urls['status']
+        return response
+    return redirect(url_for('upload_job_progress', job_id=job_id), code=303)
+
 
 uploader_html = """
 <!DOCTYPE html>
@@ -104,6 +605,18 @@ uploader_html = """
         margin-bottom: 20px;
       }
 
+      .upload-form input[type="text"] {
+        font-size: 1rem;
+        padding: 10px;
+        border: 1px solid #fff;
+        background-color: #000;
+        color: #fff;
+        border-radius: 5px;
+        width: 100%;
+        max-width: 400px;
+        margin-bottom: 20px;
+      }
+
       .upload-form input[type="file"]::file-selector-button {
         background-color: #fff;
         color: #000;
@@ -176,10 +689,19 @@ uploader_html = """
       <h3>Instructions</h3>
       <p>✔ You can upload one or more HTML files.</p>
       <p>✔ The files must have the extension <code>.htm</code> or <code>.html</code>.</p>
+      <p>
+        ✔ A whole site can also be uploaded as a <code>.zip</code> or
+        <code>.tar.gz</code> archive; the HTML files inside it are used.
+      </p>
       <p>
         ✔ After uploading, download the generated JavaScript file and add it to
         your website.
       </p>
+      <p>
+        ✔ Buttons and links without an id get one generated for them. Use
+        <em>Download Pages with Ids</em> to get your pages back with those ids
+        added, and publish them with the script.
+      </p>
       <p>✔ You're all set to enjoy voice-controlled web navigation!</p>
     </div>
 
@@ -189,16 +711,25 @@ uploader_html = """
       method="post"
       enctype="multipart/form-data"
     >
-      <label for="htmlfiles">Choose HTML files:</label>
+      <label for="htmlfiles">Choose HTML files or archives:</label>
       <input
         type="file"
         id="htmlfiles"
         name="htmlfiles"
-        accept=".html"
+        accept=".html,.htm,.zip,.tar.gz,.tgz"
         multiple
         required
       />
+      <label for="site">Site name (optional):</label>
+      <input
+        type="text"
+        id="site"
+        name="site"
+        maxlength="200"
+        placeholder="Reuse names from an earlier upload"
+      />
       <button type="submit">Upload Files</button>
+      <button type="submit" formaction="/annotate">Download Pages with Ids</button>
     </form>
 
     <footer>
@@ -213,66 +744,396 @@ uploader_html = """
 
 @app.route('/')
 def upload_page():
-    return render_template_string(uploader_html)
+    encoding = 'gzip' if 'gzip' in request.accept_encodings else 'identity'
+    response = Response(upload_page_variants[encoding], mimetype='text/html')
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'
+    response.set_etag(upload_page_variants['etag'] if encoding == 'identity' else f"{upload_page_variants['etag']}-{encoding}")
+    return response.make_conditional(request)
 
 @app.route('/process', methods=['POST'])
 def process_file():
     uploaded_files = request.files.getlist('htmlfiles')
     if not uploaded_files:
         return "No files uploaded. Please select valid HTML files.", 400
-
-    elements_data = {'buttons': [], 'anchors': [], 'nav_anchors': []}
+    site = request.form.get('site', '').strip()[:200]
 
     try:
-        for uploaded_file in uploaded_files:
-            if not uploaded_file.filename.endswith('.html'):
-                return "Invalid file type. Only HTML files are allowed.", 400
-
-            html_content = uploaded_file.read()
-            soup = BeautifulSoup(html_content, 'html.parser')
-
-            for btn in soup.find_all('button'):
-                btn_id = btn.get('id', f"btn-{uuid.uuid4().hex[:8]}")
-                btn['id'] = btn_id
-                btn_text = btn.text.strip()
-                elements_data['buttons'].append({'id': btn_id, 'text': btn_text, 'tag': 'button'})
-
-            for anchor in soup.find_all('a', href=True):
-                parent_nav = anchor.find_parent('nav')
-                if not parent_nav:
-                    anchor_id = anchor.get('id', f"a-{uuid.uuid4().hex[:8]}")
-                    anchor['id'] = anchor_id
-                    elements_data['anchors'].append({
-                        'id': anchor_id,
-                        'text': anchor.text.strip(),
-                        'href': anchor['href'],
-                        'tag': 'a'
-                    })
-
-            for nav in soup.find_all('nav'):
-                for nav_anchor in nav.find_all('a', href=True):
-                    nav_anchor_id = nav_anchor.get('id', f"nav-a-{uuid.uuid4().hex[:8]}")
-                    nav_anchor['id'] = nav_anchor_id
-                    elements_data['nav_anchors'].append({
-                        'id': nav_anchor_id,
-                        'text': nav_anchor.text.strip(),
-                        'href': nav_anchor['href'],
-                        'tag': 'nav-a'
-                    })
-
-        session['elements_data'] = elements_data
+        if wants_async():
+            return start_upload_job(uploaded_files, site)
+
+        files = [(uploaded_file.filename, uploaded_file.stream) for uploaded_file in uploaded_files]
+        for filename, _ in files:
+            check_upload_filename(filename)
+        with extraction_slot(), ExitStack() as uploads:
+            upload = build_upload(page_batches(files, uploads), site)
+
+        with metrics.stage('session'):
+            save_upload(upload)
         return redirect(url_for('select_components'))
 
+    except UploadError as e:
+        response = Response(str(e), status=e.status)
+        if e.status == 503:
+            response.headers['Retry-After'] = str(app.config['RETRY_AFTER'])
+        return response
+
+    except TooManyElements as e:
+        return f"{e} The limit is {app.config['MAX_ELEMENTS']}; split the upload into smaller batches.", 422
+
     except Exception as e:
         print(f"Error: {e}")
         return "An error occurred while processing the files.", 500
+
+
+@app.route('/annotate', methods=['POST'])
+def annotate_files():
+    """
+    Stream back the uploaded pages as a zip, with the ids /process gives
+    their buttons and anchors written into the markup, so the generated
+    script finds them on the live site. Takes the same files as /process,
+    under any field name.
+    """
+    uploaded_files = [uploaded_file for _, uploaded_file in request.files.items(multi=True)]
+    if not uploaded_files:
+        return "No files uploaded. Please select valid HTML files.", 400
+    # The response cannot change its status once it has started, so every
+    # limit that can be checked up front is checked here.
+    try:
+        for uploaded_file in uploaded_files:
+            check_upload_filename(uploaded_file.filename)
+        check_pages([(uploaded_file.filename, uploaded_file.stream) for uploaded_file in uploaded_files])
+    except UploadError as e:
+        return str(e), e.status
+
+    try:
+        slot = admission.acquire()
+    except Overloaded as e:
+        return Response(str(e), status=503, headers={'Retry-After': str(app.config['RETRY_AFTER'])})
+
+    # The request closes its files as soon as this view returns, so the
+    # response takes their streams over and closes them itself. It also
+    # holds the extraction slot until it is closed.
+    files = []
+    for uploaded_file in uploaded_files:
+        files.append((uploaded_file.filename, uploaded_file.stream))
+        uploaded_file.stream = io.BytesIO()
+
+    def pages():
+        # A page that still cannot be read, such as a tar.gz member larger
+        # than it claimed, aborts the response: the client is left with a
+        # truncated archive and a broken connection rather than a complete
+        # zip that quietly lacks pages.
+        try:
+            with ExitStack() as uploads:
+                for _, stream in files:
+                    uploads.callback(stream.close)
+                yield from iter_pages(files, uploads)
+        except UploadError as e:
+            print(f"Error: {e}")
+            raise
+
+    response = Response(stream_with_context(stream_annotated(pages())), mimetype='application/zip',
+                        headers={'Content-Disposition': 'attachment; filename=annotated.zip'})
+    response.call_on_close(lambda: admission.release(slot))
+    return response
+
+
+progress_html = """
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Processing</title>
+    <style>
+        body {
+            font-family: "Arial", sans-serif;
+            background-color: #000;
+            color: #fff;
+            display: flex;
+            flex-direction: column;
+            align-items: center;
+            justify-content: center;
+            min-height: 100vh;
+            margin: 0;
+        }
+
+        h1 {
+            font-size: 2rem;
+            text-transform: uppercase;
+            letter-spacing: 2px;
+            margin-bottom: 20px;
+        }
+
+        p {
+            font-size: 1.2rem;
+        }
+    </style>
+</head>
+<body>
+    <h1>Processing</h1>
+    <p id="progress">Waiting for a worker...</p>
+    <script>
+        const progress = document.getElementById("progress");
+        // null while the number of pages in an uploaded archive is unknown.
+        const total = {{ files | tojson }};
+        const events = new EventSource("{{ url_for('upload_job_events', job_id=job_id) }}");
+        events.onmessage = (event) => {
+            const status = JSON.parse(event.data);
+            if (status.state === "done") {
+                events.close();
+                window.location = "{{ url_for('upload_job_select', job_id=job_id) }}";
+            } else if (status.state === "failed" || status.state === "missing") {
+                events.close();
+                progress.textContent = status.error || "This upload is no longer available.";
+            } else if (status.state === "running") {
+                const parsed = total === null ? `${status.parsed || 0}` : `${status.parsed || 0} of ${total}`;
+                progress.textContent = `${parsed} files parsed, ${status.elements || 0} elements found`;
+            }
+        };
+    </script>
+</body>
+</html>
+"""
+
+
+@app.route('/process/<job_id>')
+def upload_job_progress(job_id):
+    status = upload_jobs.status(job_id)
+    if status is None:
+        abort(404)
+    return render_template('progress.html', job_id=job_id, files=status.get('files', 0))
+
+
+@app.route('/process/<job_id>/status')
+def upload_job_status(job_id):
+    status = upload_jobs.status(job_id)
+    if status is None:
+        return jsonify({'state': 'missing'}), 404
+    return jsonify(status)
+
+
+@app.route('/process/<job_id>/events')
+def upload_job_events(job_id):
+    """
+    Server-Sent Events stream of the job's status until it finishes, or for
+    at most JOB_EVENTS_SECONDS; EventSource then reconnects after the
+    `retry` delay and picks up the current status.
+    """
+    deadline = time.monotonic() + app.config['JOB_EVENTS_SECONDS']
+
+    def events():
+        yield "retry: 1000\n\n"
+        last = None
+        while True:
+            status = upload_jobs.status(job_id) or {'state': 'missing'}
+            if status != last:
+                yield f"data: {json.dumps(status, separators=(',', ':'))}\n\n"
+                last = status
+            if status['state'] in ('done', 'failed', 'missing') or time.monotonic() >= deadline:
+                return
+            time.sleep(0.25)
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/process/<job_id>/select')
+def upload_job_select(job_id):
+    status = upload_jobs.status(job_id)
+    if status is None:
+        abort(404)
+    if status['state'] == 'failed':
+        return status['error'], status['status']
+    if status['state'] != 'done':
+        return redirect(url_for('upload_job_progress', job_id=job_id))
+    use_upload(status['upload_key'])
+    return redirect(url_for('select_components'))
+
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    return f"The upload is larger than {app.config['MAX_CONTENT_LENGTH']} bytes.", 413
    
 
-@app.route('/select-components')
-def select_components():
-    elements_data = session.get('elements_data', {'buttons': [], 'anchors': [], 'nav_anchors': []})
+@app.after_request
+def add_server_timing(response):
+    if metrics.enabled:
+        server_timing = metrics.server_timing()
+        if server_timing:
+            response.headers['Server-Timing'] = server_timing
+    return response
+
+
+@app.route('/metrics')
+def metrics_page():
+    if not metrics.enabled:
+        abort(404)
+    return Response(metrics.render() + admission.render(), mimetype='text/plain; version=0.0.4')
+
+
+def has_profile_token():
+    token = request.headers.get('X-Profile-Token', '')
+    return hmac.compare_digest(token.encode('utf-8'), app.config['PROFILE_TOKEN'].encode('utf-8'))
+
+
+def start_profile():
+    if request.path.startswith('/debug/profiles'):
+        return
+    if has_profile_token() or random.random() < app.config['PROFILE_SAMPLE_RATE']:
+        g.profile = profiler.start()
+
+
+def stop_profile(error):
+    handle = g.pop('profile', None)
+    if handle is not None:
+        profiler.stop(handle, request.method, request.path, error)
+
 
-    return render_template_string("""
+# Without a profiler the hooks are not installed at all, so requests never
+# pay for them.
+if profiler is not None:
+    app.before_request(start_profile)
+    app.teardown_request(stop_profile)
+
+
+@app.route('/debug/profiles')
+def list_profiles():
+    if profiler is None:
+        abort(404)
+    if not has_profile_token():
+        abort(403)
+    return jsonify({'profiles': profiler.list()})
+
+
+@app.route('/debug/profiles/<name>')
+def download_profile(name):
+    if profiler is None:
+        abort(404)
+    if not has_profile_token():
+        abort(403)
+    path = profiler.path(name)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    return send_file(path, as_attachment=True, download_name=name)
+
+
+@app.route('/cache-stats')
+def cache_stats():
+    if extraction_cache is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **extraction_cache.stats()})
+
+
+@app.route('/admission-stats')
+def admission_stats():
+    return jsonify(admission.stats())
+
+
+# JSON API for scripts and CI pipelines. Both endpoints are stateless: they
+# never read or write the session, and responses are compact JSON.
+
+def api_error(message, status):
+    return jsonify({'error': message}), status
+
+
+@app.route('/api/v1/extract', methods=['POST'])
+def api_extract():
+    """
+    Extract elements from the HTML files and archives of a multipart upload
+    (any field name, any number of files) or from a raw text/html request
+    body, named by the optional `name` query parameter.
+    """
+    try:
+        with ExitStack() as uploads:
+            if request.mimetype == 'multipart/form-data':
+                files = [(uploaded_file.filename, uploaded_file.stream)
+                         for _, uploaded_file in request.files.items(multi=True)]
+                if not files:
+                    return api_error("No files uploaded.", 400)
+                for filename, _ in files:
+                    check_upload_filename(filename)
+                batches = page_batches(files, uploads)
+            else:
+                with metrics.stage('read'):
+                    html_content = request.get_data(cache=False)
+                if not html_content:
+                    return api_error("Empty request body.", 400)
+                if len(html_content) > app.config['MAX_FILE_BYTES']:
+                    return api_error(f"The page is larger than {app.config['MAX_FILE_BYTES']} bytes.", 413)
+                batches = [[(request.args.get('name', 'page.html'), html_content)]]
+
+            with extraction_slot():
+                upload = build_upload(batches, site='')
+
+    except UploadError as e:
+        response, status = api_error(str(e), e.status)
+        if status == 503:
+            response.headers['Retry-After'] = str(app.config['RETRY_AFTER'])
+        return response, status
+
+    except TooManyElements as e:
+        return api_error(f"{e} The limit is {app.config['MAX_ELEMENTS']}.", 422)
+
+    except Exception as e:
+        print(f"Error: {e}")
+        return api_error("An error occurred while processing the files.", 500)
+
+    with metrics.stage('json'):
+        return jsonify({
+            'files': upload['files'],
+            'elements_data': upload['elements_data'],
+            'duplicate_ids': upload['duplicate_ids'],
+        })
+
+
+def check_components(components):
+    """Return an error message if components is not a list of named elements."""
+    if not isinstance(components, list):
+        return "components must be a list."
+    for component in components:
+        if not isinstance(component, dict):
+            return "Every component must be an object."
+        if not isinstance(component.get('id'), str) or not isinstance(component.get('name'), str):
+            return "Every component needs a string id and name."
+        for field in ('href', 'tag', 'text'):
+            if not isinstance(component.get(field), (str, type(None))):
+                return f"A component's {field} must be a string."
+        aliases = component.get('aliases')
+        if aliases is not None and not (isinstance(aliases, list) and all(isinstance(alias, str) for alias in aliases)):
+            return "A component's aliases must be a list of strings."
+    return None
+
+
+@app.route('/api/v1/generate', methods=['POST'])
+def api_generate():
+    """
+    Generate scripts from {"components": [...]}, where each component is an
+    element from /api/v1/extract plus the "name" to say. A list of such
+    objects is a batch and gets a list of results, in the same order.
+    """
+    payload = request.get_json(silent=True)
+    batch = isinstance(payload, list)
+    jobs = payload if batch else [payload]
+
+    results = []
+    for job in jobs:
+        if not isinstance(job, dict) or 'components' not in job:
+            return api_error("Expected {\"components\": [...]} or a list of them.", 400)
+        error = check_components(job['components'])
+        if error:
+            return api_error(error, 400)
+        with metrics.stage('jsgen'):
+            results.append({'js_code': generate_js_code(job['components']), 'manifest': job['components']})
+
+    with metrics.stage('json'):
+        return jsonify(results if batch else results[0])
+
+
+select_components_html = """
     <!DOCTYPE html>
 <html lang="en">
 <head>
@@ -367,6 +1228,45 @@ def select_components():
             color: #ccc;
         }
 
+        .toolbar {
+            display: flex;
+            align-items: center;
+            gap: 10px;
+            margin: 10px 0;
+        }
+
+        .toolbar input[type="search"], .toolbar select {
+            flex-grow: 1;
+            padding: 10px;
+            font-size: 1rem;
+            border: 1px solid #fff;
+            background-color: #000;
+            color: #fff;
+            border-radius: 5px;
+        }
+
+        .toolbar button {
+            width: auto;
+            flex-grow: 1;
+        }
+
+        .toolbar button:disabled {
+            background-color: #555;
+            cursor: default;
+        }
+
+        #status {
+            margin: 10px 0;
+        }
+
+        .warning {
+            margin-bottom: 20px;
+            padding: 15px;
+            border: 1px solid #fff;
+            border-radius: 10px;
+            background: #222;
+        }
+
         button {
             width: 100%;
             padding: 15px;
@@ -420,79 +1320,237 @@ def select_components():
         <h1>Select Components</h1>
     </header>
     <form action="/generate" method="post">
-        <h2>Buttons</h2>
-        {% for button in buttons %}
-        <div class="component">
-            <input type="checkbox" name="components" value="{{ button.id }}">
-            <label for="{{ button.id }}">ID: {{ button.id }}, Text: {{ button.text }}</label>
-            <input type="text" name="names[{{ button.id }}]" placeholder="Enter name/command">
+        {% if duplicate_ids %}
+        <div class="warning">
+            <h2>Duplicate IDs</h2>
+            {% for element_id, files in duplicate_ids.items() %}
+            <p>ID {{ element_id }} appears in {{ files | join(', ') }}. Only the first one is used.</p>
+            {% endfor %}
         </div>
-        {% endfor %}
-
-        <h2>Standalone Anchors</h2>
-        {% for anchor in anchors %}
-        <div class="component">
-            <input type="checkbox" name="components" value="{{ anchor.id }}">
-            <label for="{{ anchor.id }}">ID: {{ anchor.id }}, Text: {{ anchor.text }}, Href: {{ anchor.href }}</label>
-            <input type="text" name="names[{{ anchor.id }}]" placeholder="Enter name/command">
+        {% endif %}
+
+        <div class="toolbar">
+            <input type="search" id="search" placeholder="Filter by text, href or ID" autocomplete="off">
+            <select id="category">
+                <option value="">All ({{ counts.buttons + counts.anchors + counts.nav_anchors }})</option>
+                <option value="buttons">Buttons ({{ counts.buttons }})</option>
+                <option value="anchors">Standalone Anchors ({{ counts.anchors }})</option>
+                <option value="nav_anchors">Navbar Anchors ({{ counts.nav_anchors }})</option>
+            </select>
         </div>
-        {% endfor %}
+        <div class="toolbar">
+            <button type="button" id="select-matching">Select all matching</button>
+            <button type="button" id="clear-selection">Clear selection</button>
+        </div>
+        <p id="status"></p>
 
-        <h2>Navbar Anchors</h2>
-        {% for nav_anchor in nav_anchors %}
-        <div class="component">
-            <input type="checkbox" name="components" value="{{ nav_anchor.id }}">
-            <label for="{{ nav_anchor.id }}">ID: {{ nav_anchor.id }}, Text: {{ nav_anchor.text }}, Href: {{ nav_anchor.href }}</label>
-            <input type="text" name="names[{{ nav_anchor.id }}]" placeholder="Enter name/command">
+        <div id="components"></div>
+
+        <div class="toolbar">
+            <button type="button" id="previous">Previous</button>
+            <span id="page"></span>
+            <button type="button" id="next">Next</button>
         </div>
-        {% endfor %}
 
+        <div id="submitted"></div>
         <button type="submit">Generate</button>
     </form>
     <footer>
         <p>© 2024 IntelliNet. All rights reserved. | Simplifying web navigation
         with voice assistance.</p>
     </footer>
-</body>
-</html>
-    """, buttons=elements_data['buttons'], anchors=elements_data['anchors'], nav_anchors=elements_data['nav_anchors'])
-
+    <script>
+        // Elements are fetched a page at a time. The selection and any names
+        // typed so far live here and are turned into form fields on submit.
+        const PAGE_SIZE = 100;
+        const ELEMENTS_URL = "{{ url_for('select_component_elements') }}";
+        const selected = new Map(Object.entries({{ preselected | tojson }}));
+        const names = new Map();
+        let query = "";
+        let category = "";
+        let offset = 0;
+        let total = 0;
+        let matching = null;
+
+        const list = document.getElementById("components");
+        const status = document.getElementById("status");
+
+        function describe(item) {
+            let text = `ID: ${item.id}, Text: ${item.text}`;
+            if (item.href !== undefined) {
+                text += `, Href: ${item.href}`;
+            }
+            return text;
+        }
 
-    
+        function row(item) {
+            const component = document.createElement("div");
+            component.className = "component";
+            const checkbox = document.createElement("input");
+            checkbox.type = "checkbox";
+            checkbox.checked = matching !== null || selected.has(item.id);
+            checkbox.disabled = matching !== null;
+            const label = document.createElement("label");
+            label.textContent = describe(item);
+            const name = document.createElement("input");
+            name.type = "text";
+            name.placeholder = "Enter name/command";
+            name.value = names.has(item.id) ? names.get(item.id) : (selected.get(item.id) || item.name || "");
+            checkbox.addEventListener("change", () => {
+                if (checkbox.checked) {
+                    selected.set(item.id, name.value);
+                } else {
+                    selected.delete(item.id);
+                }
+                showStatus();
+            });
+            name.addEventListener("input", () => {
+                names.set(item.id, name.value);
+                if (selected.has(item.id)) {
+                    selected.set(item.id, name.value);
+                }
+            });
+            component.append(checkbox, label, name);
+            return component;
+        }
 
+        function showStatus() {
+            status.textContent = matching !== null
+                ? `All ${matching.total} matching elements are selected.`
+                : `${selected.size} selected, ${total} matching.`;
+        }
 
-@app.route('/generate', methods=['POST'])
-def generate_results():
-    selected_components = request.form.getlist('components')
-    component_names = request.form.to_dict(flat=False)
-    if not selected_components:
-        return "No components selected.", 400
+        async function load() {
+            const params = new URLSearchParams({ q: query, category: category, offset: offset, limit: PAGE_SIZE });
+            const response = await fetch(`${ELEMENTS_URL}?${params}`);
+            const page = await response.json();
+            if (page.offset !== offset || params.get("q") !== query || params.get("category") !== category) {
+                return;  // A newer request has been made since.
+            }
+            total = page.total;
+            list.replaceChildren(...page.items.map(row));
+            document.getElementById("page").textContent =
+                total ? `${offset + 1}-${offset + page.items.length} of ${total}` : "No matching elements";
+            document.getElementById("previous").disabled = offset === 0;
+            document.getElementById("next").disabled = offset + PAGE_SIZE >= total;
+            showStatus();
+        }
 
-    elements_data = session.get('elements_data', {})
-    json_data = []
+        let searchTimer = null;
+        document.getElementById("search").addEventListener("input", (event) => {
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(() => {
+                query = event.target.value;
+                // "Select all matching" covered the previous search only.
+                matching = null;
+                offset = 0;
+                load();
+            }, 150);
+        });
+        document.getElementById("category").addEventListener("change", (event) => {
+            category = event.target.value;
+            matching = null;
+            offset = 0;
+            load();
+        });
+        document.getElementById("previous").addEventListener("click", () => {
+            offset = Math.max(0, offset - PAGE_SIZE);
+            load();
+        });
+        document.getElementById("next").addEventListener("click", () => {
+            offset += PAGE_SIZE;
+            load();
+        });
+        document.getElementById("select-matching").addEventListener("click", () => {
+            matching = { query: query, category: category, total: total };
+            load();
+        });
+        document.getElementById("clear-selection").addEventListener("click", () => {
+            matching = null;
+            selected.clear();
+            load();
+        });
 
-    # Prepare selected component data
-    for component_id in selected_components:
-        name = component_names.get(f"names[{component_id}]", [f"default_name_{component_id}"])[0]
-        for category in ['buttons', 'anchors', 'nav_anchors']:
-            component = next((item for item in elements_data[category] if item['id'] == component_id), None)
-            if component:
-                component_data = {**component, 'name': name}
-                json_data.append(component_data)
-                break
+        document.querySelector("form").addEventListener("submit", () => {
+            const fields = document.getElementById("submitted");
+            const add = (name, value) => {
+                const field = document.createElement("input");
+                field.type = "hidden";
+                field.name = name;
+                field.value = value;
+                fields.append(field);
+            };
+            fields.replaceChildren();
+            for (const [id, name] of names) {
+                add(`names[${id}]`, name);
+            }
+            for (const [id, name] of selected) {
+                add("components", id);
+                if (!names.has(id)) {
+                    add(`names[${id}]`, name);
+                }
+            }
+            if (matching !== null) {
+                add("match_query", matching.query);
+                add("match_category", matching.category);
+            }
+        });
 
-    # Save to JSON
-    try:
-        json_file_path = "selected_components.json"
-        with open(json_file_path, 'w') as json_file:
-            json.dump(json_data, json_file, indent=4)
-    except Exception as e:
-        print(f"Error: {e}")
-        return "An error occurred while saving the data.", 500
+        load();
+    </script>
+</body>
+</html>
+    """
 
-    js_code = generate_js_code(json_data)
 
-    return render_template_string("""
+@app.route('/select-components')
+def select_components():
+    with metrics.stage('session'):
+        upload = load_upload()
+        site_choices = load_site_choices(upload.get('site'))
+    elements_data = upload['elements_data']
+    counts = {category: len(elements) for category, elements in elements_data.items()}
+    # The site's previous selection, limited to the elements of this upload
+    # and keyed by the id each element is listed under now.
+    preselected = {}
+    for component_id in site_choices['selected']:
+        entry = upload['id_index'].get(component_id)
+        if entry is not None:
+            category, position = entry
+            preselected[elements_data[category][position]['id']] = site_choices['names'].get(component_id, '')
+
+    with metrics.stage('render'):
+        return render_template('select_components.html', counts=counts, duplicate_ids=upload['duplicate_ids'],
+                               preselected=preselected)
+
+
+@app.route('/select-components/elements')
+def select_component_elements():
+    """
+    One page of the elements matching `q` (a substring of their id, text or
+    href) in `category`, or in every category if none is given.
+    """
+    category = request.args.get('category') or None
+    if category not in (None, 'buttons', 'anchors', 'nav_anchors'):
+        return jsonify({'error': f"Unknown category: {category}"}), 400
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', 100, type=int), 1), app.config['SELECT_PAGE_LIMIT'])
+
+    with metrics.stage('session'):
+        upload, index = load_upload_index()
+        site_choices = load_site_choices(upload.get('site'))
+    with metrics.stage('search'):
+        matches = index.search(request.args.get('q', ''), category)
+
+    elements_data = upload['elements_data']
+    items = []
+    for match_category, position in matches[offset:offset + limit]:
+        element = elements_data[match_category][position]
+        items.append({**element, 'category': match_category, 'name': site_choices['names'].get(element['id'], '')})
+    return jsonify({'total': len(matches), 'offset': offset, 'items': items})
+
+
+results_html = """
 <!DOCTYPE html>
 <html lang="en">
 <head>
@@ -623,6 +1681,10 @@ def generate_results():
     </ul>
 
     <h1>Generated JavaScript Code</h1>
+    <p>Add it to your site with:</p>
+    <p><code>&lt;script src="{{ url_for('serve_bundle', bundle_hash=runtime_hash, _external=True) }}" data-commands="{{ url_for('serve_command_table', table_hash=table_hash, _external=True) }}" defer&gt;&lt;/script&gt;</code></p>
+    <p>The runtime is shared by every site and cached by browsers; only the command table is specific to yours. To load everything as one script instead, use:</p>
+    <p><code>&lt;script src="{{ url_for('serve_bundle', bundle_hash=bundle_hash, _external=True) }}" defer&gt;&lt;/script&gt;</code></p>
     <p>Preview the generated JavaScript code below:</p>
 
     <iframe id="js-iframe" srcdoc="
@@ -635,6 +1697,7 @@ def generate_results():
     <div class="button-container">
         <button id="copy-js">Copy JavaScript Code</button>
         <button id="download-js">Download JavaScript File</button>
+        <button id="download-manifest">Download Manifest</button>
     </div>
 
     <script>
@@ -650,165 +1713,157 @@ def generate_results():
             });
         });
 
-        // Download JavaScript code as a file
+        // Download the files saved for this job
         document.getElementById('download-js').addEventListener('click', function () {
-            const iframe = document.getElementById('js-iframe');
-            const code = iframe.contentDocument.querySelector('pre').textContent;
+            window.location.href = '{{ url_for('download_artifact', job_id=job_id, name='generated_code.js') }}';
+        });
 
-            const blob = new Blob([code], { type: 'application/javascript' });
-            const link = document.createElement('a');
-            link.href = URL.createObjectURL(blob);
-            link.download = 'generated_code.js';
-            link.click();
+        document.getElementById('download-manifest').addEventListener('click', function () {
+            window.location.href = '{{ url_for('download_artifact', job_id=job_id, name='manifest.json') }}';
         });
     </script>
 </body>
 </html>
-""", results=json_data, js_code=js_code)
+"""
 
 
-def generate_js_code(selected_components):
-    """
-    Generate JavaScript code based on the selected components
-    """
-    js_code = """// Initialize Speech Recognition
-const SpeechRecognition = window.SpeechRecognition || window.webkitSpeechRecognition;
-const recognition = new SpeechRecognition();
-
-recognition.continuous = true;
-recognition.lang = 'en-US';
-
-let isStoppedManually = false; // Flag to track manual stop
-
-// Dynamically create the output div
-let output = document.getElementById('output');
-if (!output) {
-    output = document.createElement('div'); // Create the output div if it doesn't exist
-    output.id = 'output';
-    output.textContent = 'Say "add task" to create a to-do.';
-    document.body.appendChild(output); // Append it to the body
-}
+@app.route('/generate', methods=['POST'])
+def generate_results():
+    selected_components = request.form.getlist('components')
+    match_query = request.form.get('match_query')
+    if not selected_components and match_query is None:
+        return "No components selected.", 400
 
-// Start speech recognition automatically when the page loads
-window.addEventListener('DOMContentLoaded', () => {
-    recognition.start();
-    output.textContent = 'Voice recognition started automatically!';
-});
+    with metrics.stage('session'):
+        upload, index = load_upload_index()
+    elements_data = upload['elements_data']
+    id_index = upload['id_index']
+    json_data = []
 
-recognition.addEventListener('end', () => {
-    if (!isStoppedManually) {
-        recognition.start();
-        output.textContent = 'Voice recognition restarted automatically!';
-    }
-});
+    # Prepare selected component data
+    for component_id in selected_components:
+        entry = id_index.get(component_id)
+        if entry is None:
+            continue
+        category, position = entry
+        name = request.form.get(f"names[{component_id}]", f"default_name_{component_id}")
+        json_data.append({**elements_data[category][position], 'name': name})
+
+    # "Select all matching" sends the search instead of every id. Matches
+    # without a typed name are named after their text.
+    if match_query is not None:
+        chosen = set(selected_components)
+        for category, position in index.search(match_query, request.form.get('match_category') or None):
+            element = elements_data[category][position]
+            if element['id'] in chosen or id_index.get(element['id']) != [category, position]:
+                continue
+            chosen.add(element['id'])
+            name = request.form.get(f"names[{element['id']}]") or element['text'] or f"default_name_{element['id']}"
+            json_data.append({**element, 'name': name})
+    if not selected_components and not json_data:
+        return "No components selected.", 400
 
-document.addEventListener('keydown', (event) => {
-    if (event.key.toLowerCase() === 'v') { 
-        isStoppedManually = false; 
-        recognition.start();
-        output.textContent = 'Voice recognition started!';
-    }
-});
+    with metrics.stage('jsgen'):
+        command_table = generate_command_table(json_data)
+        js_code = embed_command_table(command_table)
 
-document.addEventListener('keydown', (event) => {
-    if (event.key.toLowerCase() === 'q') { 
-        isStoppedManually = true; 
-        recognition.stop();
-        output.textContent = 'Voice recognition stopped!';
-    }
-});
+    # Remember the names for the next upload of the same site
+    site = upload.get('site')
+    if site:
+        site_choices = load_site_choices(site)
+        site_choices['names'].update((component['id'], component['name']) for component in json_data)
+        site_choices['selected'] = [component['id'] for component in json_data]
+        site_store.save(site_choices, f'names/{site}')
 
-recognition.addEventListener('result', (event) => {
-    const transcript = event.results[event.resultIndex][0].transcript.toLowerCase();
-    output.textContent = transcript;
+    # Save the manifest and script for this job
+    try:
+        with metrics.stage('json'):
+            job_id = artifact_store.create_job()
+            artifact_store.write(job_id, 'manifest.json', json.dumps(json_data, separators=(',', ':')))
+            artifact_store.write(job_id, 'generated_code.js', js_code)
+        with metrics.stage('bundle'):
+            bundle_hash = bundle_store.publish(js_code)
+            table_hash = bundle_store.publish_json(command_table)
+    except Exception as e:
+        print(f"Error: {e}")
+        return "An error occurred while saving the data.", 500
 
-    // Example Commands
-    if (transcript.includes('scroll up')) {
-        window.scrollBy(0, -500);
-        output.textContent += ' - Scrolled up!';
-    }
+    with metrics.stage('render'):
+        return render_template('results.html', results=json_data, js_code=js_code, job_id=job_id,
+                               bundle_hash=bundle_hash, runtime_hash=runtime_hash, table_hash=table_hash)
 
-    if (transcript.includes('scroll down')) {
-        window.scrollBy(0, 500);
-        output.textContent += ' - Scrolled down!';
-    }
 
-    if (transcript.includes('go back')) {
-        window.history.back();
-        output.textContent += ' - Navigated back!';
-    }
-"""
+@app.route('/jobs/<job_id>/<name>')
+def download_artifact(job_id, name):
+    path = artifact_store.path(job_id, name)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    return send_file(path, as_attachment=True, download_name=name)
 
-    # Generate commands based on selected components
-    for component in selected_components:
-        component_id = component['id']
-        name = component['name']
-        tag = component.get('tag')
-        href=component.get('href')
-
-        # Generate commands for buttons
-        if tag == 'button':
-            js_code += f"""
-    if (transcript.includes('{name.lower()}')) {{
-    const {component_id.replace('-', '_')} = document.getElementById('{component_id}');
-    if ({component_id.replace('-', '_')}) {{
-        {component_id.replace('-', '_')}.click();
-        output.textContent += ' - {name} button clicked!';
-    }} else {{
-        output.textContent += ' - {name} button not found!';
-    }}
-}}
-"""
-       
-
-        # Generate commands for anchors
-        elif tag == 'a':
-            js_code += f"""
-    if (transcript.includes('{name.lower()}')) {{
-        const component_id = document.getElementById('{component_id}');
-        if (component_id) {{
-            component_id.click();
-            output.textContent += ' - Navigating to {name}!';
-        }} else {{
-            output.textContent += ' - {name} anchor not found!';
-        }}
-    }}
-"""
 
-        # Generate commands for navbar anchors
-        elif tag == 'nav-a':
-            href = component.get('href')
-            
-            if href:  # Check if href is not None or empty
-                href = href.replace('#', '')  # Remove the '#' from href if present
-            else:
-                href = ''  # Set it to an empty string if href is None
-            js_code += f"""
-    if (transcript.includes('go to {name.lower()}')) {{
-        scrollToSection('{href}');
-        output.textContent += ' - Scrolled to {name.lower()}!';
-    }}
-"""
+def serve_published(digest, extension, mimetype):
+    bundle = bundle_store.load(digest, request.accept_encodings, extension)
+    if bundle is None:
+        abort(404)
+    encoding, payload = bundle
+
+    response = Response(payload, mimetype=mimetype)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    # Each encoding is a different representation, so it gets its own tag.
+    response.set_etag(digest if encoding == 'identity' else f"{digest}-{encoding}")
+    return response
+
+
+@app.route('/bundle/<bundle_hash>.js')
+def serve_bundle(bundle_hash):
+    return serve_published(bundle_hash, '.js', 'application/javascript').make_conditional(request)
+
 
+@app.route('/commands/<table_hash>.json')
+def serve_command_table(table_hash):
+    response = serve_published(table_hash, '.json', 'application/json')
+    # The runtime fetches the table from the sites that include it.
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response.make_conditional(request)
 
-    js_code += """
-});
-// Error handling for speech recognition
-recognition.addEventListener('error', (event) => {
-    console.error('Error:', event.error);
-    output.textContent = `Error: ${event.error}`;
-});
 
-// Function to smoothly scroll to a specific section
-function scrollToSection(sectionId) {
-    document.getElementById(sectionId)?.scrollIntoView({ behavior: 'smooth' });
+TEMPLATES = {
+    'upload.html': uploader_html,
+    'select_components.html': select_components_html,
+    'results.html': results_html,
+    'progress.html': progress_html,
 }
 
-// Ensure 'Let's Connect' button scrolls to section
-document.getElementById('connect')?.addEventListener('click', () => scrollToSection("let us connect"));
-"""
+# Templates are compiled once per process, and their bytecode is cached on
+# disk so that freshly booted workers skip compiling them altogether.
+app.config['TEMPLATE_CACHE_DIR'] = os.environ.get('INTELLINET_TEMPLATE_CACHE_DIR', os.path.join(app.instance_path, 'jinja_cache'))
+os.makedirs(app.config['TEMPLATE_CACHE_DIR'], exist_ok=True)
+app.jinja_options = {
+    **app.jinja_options,
+    'loader': DictLoader(TEMPLATES),
+    'bytecode_cache': FileSystemBytecodeCache(app.config['TEMPLATE_CACHE_DIR']),
+}
+for template_name in TEMPLATES:
+    app.jinja_env.get_template(template_name)
+
+
+def prerender_upload_page():
+    """
+    The landing page has no dynamic content, so it is rendered and
+    compressed once instead of on every request.
+    """
+    body = app.jinja_env.get_template('upload.html').render().encode('utf-8')
+    return {
+        'identity': body,
+        'gzip': gzip.compress(body, compresslevel=9, mtime=0),
+        'etag': hashlib.sha256(body).hexdigest()[:20],
+    }
+
 
-    return js_code
+upload_page_variants = prerender_upload_page()
 
 if __name__ == '__main__':  # Corrected this line
     app.run(debug=True)
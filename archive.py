@@ -0,0 +1,127 @@
+import posixpath
+import tarfile
+import zipfile
+import zlib
+
+HTML_EXTENSIONS = ('.html', '.htm')
+ZIP_EXTENSIONS = ('.zip',)
+TAR_EXTENSIONS = ('.tar.gz', '.tgz')
+
+
+class ArchiveError(Exception):
+    """An archive is unreadable or breaks one of the limits it is read with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def is_html(filename):
+    return filename.lower().endswith(HTML_EXTENSIONS)
+
+
+def is_archive(filename):
+    return filename.lower().endswith(ZIP_EXTENSIONS + TAR_EXTENSIONS)
+
+
+def _read_member(member_file, name, max_member_bytes):
+    # Sizes recorded in an archive can lie, so never read past the limit.
+    data = member_file.read(max_member_bytes + 1)
+    if len(data) > max_member_bytes:
+        raise ArchiveError(f"{name} is larger than {max_member_bytes} bytes.", 413)
+    return data
+
+
+def _skip(name):
+    # Directories, hidden files and macOS resource forks are never pages.
+    parts = name.split('/')
+    return not is_html(name) or any(part.startswith('.') or part == '__MACOSX' for part in parts)
+
+
+def _zip_members(archive, filename, max_member_bytes, max_members, max_total_bytes):
+    """
+    Return (name, info) for every HTML member of an open zip archive,
+    checked against the limits by the sizes its central directory records.
+    """
+    members = []
+    declared_bytes = 0
+    for info in archive.infolist():
+        name = posixpath.normpath(info.filename)
+        if info.is_dir() or _skip(name):
+            continue
+        if len(members) >= max_members:
+            raise ArchiveError(f"{filename} holds more than {max_members} HTML files.", 413)
+        if info.file_size > max_member_bytes:
+            raise ArchiveError(f"{name} is larger than {max_member_bytes} bytes.", 413)
+        declared_bytes += info.file_size
+        if declared_bytes > max_total_bytes:
+            raise ArchiveError(f"{filename} holds more than {max_total_bytes} bytes of HTML.", 413)
+        members.append((name, info))
+    return members
+
+
+def check_archive(fileobj, filename, max_member_bytes, max_members, max_total_bytes):
+    """
+    Check an archive against the limits of iter_archive() before anything
+    is inflated, and return the number of bytes of HTML it declares. A zip
+    is checked through its central directory. A tar.gz records its sizes
+    along the stream, so only its first member header is read, which
+    catches files that are not a tar.gz at all. Recorded sizes can lie, so
+    iter_archive() still checks what it reads.
+    """
+    try:
+        if filename.lower().endswith(ZIP_EXTENSIONS):
+            with zipfile.ZipFile(fileobj) as archive:
+                members = _zip_members(archive, filename, max_member_bytes, max_members, max_total_bytes)
+            return sum(info.file_size for _, info in members)
+        with tarfile.open(fileobj=fileobj, mode='r|gz') as archive:
+            archive.next()
+        return 0
+    except (zipfile.BadZipFile, tarfile.TarError, zlib.error, EOFError, OSError) as e:
+        raise ArchiveError(f"{filename} is not a valid archive: {e}", 400)
+    finally:
+        fileobj.seek(0)
+
+
+def iter_archive(fileobj, filename, max_member_bytes, max_members, max_total_bytes):
+    """
+    Yield (name, data) for every HTML member of a .zip or .tar.gz archive,
+    in archive order, reading one member at a time. At most `max_members`
+    members adding up to `max_total_bytes` are read.
+
+    A tar.gz is decompressed as a single forward stream. A zip is read
+    through its central directory, which needs a seekable file object, but
+    each member is still inflated on its own as it is reached. Only the
+    member being yielded is ever held in memory.
+    """
+    lowered = filename.lower()
+    members = 0
+    total_bytes = 0
+    try:
+        if lowered.endswith(ZIP_EXTENSIONS):
+            with zipfile.ZipFile(fileobj) as archive:
+                for name, info in _zip_members(archive, filename, max_member_bytes, max_members, max_total_bytes):
+                    with archive.open(info) as member_file:
+                        data = _read_member(member_file, name, max_member_bytes)
+                    total_bytes += len(data)
+                    if total_bytes > max_total_bytes:
+                        raise ArchiveError(f"{filename} holds more than {max_total_bytes} bytes of HTML.", 413)
+                    yield name, data
+        else:
+            with tarfile.open(fileobj=fileobj, mode='r|gz') as archive:
+                for info in archive:
+                    name = posixpath.normpath(info.name)
+                    if not info.isfile() or _skip(name):
+                        continue
+                    members += 1
+                    if members > max_members:
+                        raise ArchiveError(f"{filename} holds more than {max_members} HTML files.", 413)
+                    if info.size > max_member_bytes:
+                        raise ArchiveError(f"{name} is larger than {max_member_bytes} bytes.", 413)
+                    data = _read_member(archive.extractfile(info), name, max_member_bytes)
+                    total_bytes += len(data)
+                    if total_bytes > max_total_bytes:
+                        raise ArchiveError(f"{filename} holds more than {max_total_bytes} bytes of HTML.", 413)
+                    yield name, data
+    except (zipfile.BadZipFile, tarfile.TarError, zlib.error, EOFError, OSError) as e:
+        raise ArchiveError(f"{filename} is not a valid archive: {e}", 400)
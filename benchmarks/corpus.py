@@ -0,0 +1,111 @@
+"""
+Seeded generator of synthetic pages for the benchmarks.
+
+Pages are made of sections nested a random number of divs deep, holding
+paragraphs, buttons and anchors, with a navbar every so often. The same
+arguments and seed always give the same bytes.
+
+Usage: python benchmarks/corpus.py OUTPUT_DIR [--sizes 10k,1m] [--pages 3] [--seed 0]
+"""
+import argparse
+import os
+import random
+
+WORDS = (
+    'home about contact pricing blog docs search login signup account help '
+    'support settings profile cart checkout order news events careers team '
+    'product features download start stop next previous open close submit'
+).split()
+
+UNITS = {'k': 1024, 'm': 1024 * 1024}
+
+DEFAULTS = {
+    'depth': 6,
+    'nav_density': 0.1,
+    'button_ratio': 0.15,
+    'anchor_ratio': 0.25,
+}
+
+
+def parse_size(text):
+    """Parse sizes such as 10k, 1m or 4096 into a number of bytes."""
+    text = text.strip().lower()
+    if text[-1:] in UNITS:
+        return int(float(text[:-1]) * UNITS[text[-1]])
+    return int(text)
+
+
+def generate_page(size, seed=0, depth=6, nav_density=0.1, button_ratio=0.15, anchor_ratio=0.25):
+    """
+    Return a page of roughly `size` bytes.
+
+    depth        deepest nesting of the sections, in divs
+    nav_density  chance that a section starts with a navbar
+    button_ratio share of a section's items that are buttons
+    anchor_ratio share of a section's items that are anchors; the rest are
+                 paragraphs of text
+    """
+    rng = random.Random(seed)
+    parts = ['<!DOCTYPE html>\n<html lang="en">\n<head><meta charset="UTF-8"><title>Synthetic page</title></head>\n<body>\n']
+    length = len(parts[0])
+    section = 0
+
+    def words(count):
+        return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+    while length < size:
+        section += 1
+        levels = rng.randint(1, depth)
+        block = ['<div class="level">' * levels, f'<section id="section-{section}">']
+        if rng.random() < nav_density:
+            links = ''.join(
+                f'<li><a href="#section-{rng.randint(1, section)}">{words(1)}</a></li>'
+                for _ in range(rng.randint(3, 8))
+            )
+            block.append(f'<nav><ul>{links}</ul></nav>')
+        for _ in range(rng.randint(3, 12)):
+            kind = rng.random()
+            if kind < button_ratio:
+                if rng.random() < 0.3:
+                    block.append(f'<button id="button-{section}-{len(block)}">{words(2)}</button>')
+                else:
+                    block.append(f'<button type="button">{words(2)}</button>')
+            elif kind < button_ratio + anchor_ratio:
+                block.append(f'<a href="/{rng.choice(WORDS)}/{section}">{words(2)}</a>')
+            else:
+                block.append(f'<p>{words(rng.randint(8, 40))}</p>')
+        block.append('</section>' + '</div>' * levels + '\n')
+        text = ''.join(block)
+        parts.append(text)
+        length += len(text)
+
+    parts.append('</body>\n</html>\n')
+    return ''.join(parts).encode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('output_dir')
+    parser.add_argument('--sizes', default='10k,100k,1m', help='comma-separated page sizes')
+    parser.add_argument('--pages', type=int, default=1, help='pages to write per size')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--depth', type=int, default=DEFAULTS['depth'])
+    parser.add_argument('--nav-density', type=float, default=DEFAULTS['nav_density'])
+    parser.add_argument('--button-ratio', type=float, default=DEFAULTS['button_ratio'])
+    parser.add_argument('--anchor-ratio', type=float, default=DEFAULTS['anchor_ratio'])
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for size_text in args.sizes.split(','):
+        size = parse_size(size_text)
+        for page in range(args.pages):
+            html_content = generate_page(size, seed=args.seed + page, depth=args.depth, nav_density=args.nav_density,
+                                         button_ratio=args.button_ratio, anchor_ratio=args.anchor_ratio)
+            path = os.path.join(args.output_dir, f"page-{size_text.strip()}-{page}.html")
+            with open(path, 'wb') as page_file:
+                page_file.write(html_content)
+            print(f"{path}: {len(html_content)} bytes")
+
+
+if __name__ == '__main__':
+    main()
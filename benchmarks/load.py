@@ -0,0 +1,403 @@
+"""
+Load test the upload -> select -> generate flow under concurrency.
+
+Starts the app under gunicorn in a scratch directory (or targets a server
+that is already running with --url) and runs --users virtual users for
+--duration seconds. Each user, with its own session cookie, repeatedly:
+
+    1. posts pages from the synthetic corpus to /process,
+    2. follows the redirect to /select-components,
+    3. fetches the first --select elements from /select-components/elements,
+    4. posts them, named, to /generate.
+
+Page sizes are drawn from --mix, comma-separated size:weight pairs. The
+report gives p50/p95/p99 latency per route, completed flows and requests
+per second, error rates, and the peak RSS of every server worker (read
+from /proc, so only on Linux):
+
+    python benchmarks/load.py --workers 4 --users 20 --duration 60 --mix 10k:70,100k:25,1m:5
+
+Usage: python benchmarks/load.py [--url URL] [--users 10] [--duration 30] [--mix 10k:80,100k:20]
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
+from collections import Counter
+from http.cookies import SimpleCookie
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+from corpus import DEFAULTS, generate_page, parse_size  # noqa: E402
+
+ROUTES = ('process', 'select', 'elements', 'generate')
+PERCENTILES = (50, 95, 99)
+# Seconds to wait for a started server to answer.
+STARTUP_TIMEOUT = 30
+
+
+def parse_mix(text):
+    """Parse '10k:70,1m:5' into [(label, size in bytes, weight), ...]."""
+    mix = []
+    for item in text.split(','):
+        label, _, weight = item.strip().partition(':')
+        mix.append((label, parse_size(label), float(weight or 1)))
+    return mix
+
+
+def percentile(ordered, percent):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    rank = max(0, min(len(ordered) - 1, math.ceil(percent / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def encode_multipart(field, files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for filename, content in files:
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: text/html\r\n\r\n'.encode()
+        )
+        parts.append(content)
+        parts.append(b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class Recorder:
+    """Latencies and failures per route, shared by every virtual user."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {route: [] for route in ROUTES}
+        self.errors = {route: Counter() for route in ROUTES}
+        self.flows = 0
+        self.failed_flows = 0
+
+    def record(self, route, seconds, error=None):
+        with self._lock:
+            self.latencies[route].append(seconds)
+            if error is not None:
+                self.errors[route][error] += 1
+
+    def finish(self, ok):
+        with self._lock:
+            if ok:
+                self.flows += 1
+            else:
+                self.failed_flows += 1
+
+
+class FlowError(Exception):
+    pass
+
+
+class VirtualUser:
+    """One browser: a connection to the server and a session cookie."""
+
+    def __init__(self, url, recorder, timeout):
+        parsed = urllib.parse.urlsplit(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.recorder = recorder
+        self.timeout = timeout
+        self.cookies = SimpleCookie()
+        self.connection = None
+
+    def request(self, route, method, path, body=None, headers=None, expect=200):
+        headers = dict(headers or {})
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f"{name}={morsel.value}" for name, morsel in self.cookies.items())
+        started = time.perf_counter()
+        try:
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            self.connection.close()
+            self.connection = None
+            self.recorder.record(route, time.perf_counter() - started, type(e).__name__)
+            raise FlowError(route)
+        elapsed = time.perf_counter() - started
+
+        for value in response.headers.get_all('Set-Cookie') or ():
+            self.cookies.load(value)
+        if response.will_close:
+            self.connection.close()
+            self.connection = None
+        if response.status != expect:
+            self.recorder.record(route, elapsed, f"HTTP {response.status}")
+            raise FlowError(route)
+        self.recorder.record(route, elapsed)
+        return response, data
+
+    def flow(self, pages, select):
+        body, content_type = encode_multipart('htmlfiles', pages)
+        response, _ = self.request('process', 'POST', '/process', body, {'Content-Type': content_type}, expect=302)
+        location = urllib.parse.urlsplit(response.headers.get('Location', '/select-components')).path
+        self.request('select', 'GET', location)
+
+        _, data = self.request('elements', 'GET', f"/select-components/elements?limit={select}")
+        ids = [item['id'] for item in json.loads(data)['items']]
+        form = [('components', element_id) for element_id in ids]
+        form += [(f"names[{element_id}]", f"command {position}") for position, element_id in enumerate(ids)]
+        self.request('generate', 'POST', '/generate', urllib.parse.urlencode(form).encode(),
+                     {'Content-Type': 'application/x-www-form-urlencoded'})
+
+
+def run_user(url, corpus, mix, args, recorder, seed, start_at, deadline):
+    rng = random.Random(seed)
+    user = VirtualUser(url, recorder, args.timeout)
+    labels = [label for label, _, _ in mix]
+    weights = [weight for _, _, weight in mix]
+    time.sleep(max(0.0, start_at - time.monotonic()))
+    while time.monotonic() < deadline:
+        pages = []
+        for position in range(args.files):
+            label = rng.choices(labels, weights)[0]
+            pages.append((f"page-{position}.html", rng.choice(corpus[label])))
+        try:
+            user.flow(pages, args.select)
+            recorder.finish(True)
+        except FlowError:
+            recorder.finish(False)
+
+
+def worker_pids(pid):
+    """The server's worker processes: the children of pid, or pid itself."""
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as children_file:
+            children = [int(child) for child in children_file.read().split()]
+    except OSError:
+        return []
+    return children or [pid]
+
+
+def rss_bytes(pid):
+    try:
+        with open(f"/proc/{pid}/status") as status_file:
+            for line in status_file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class RssSampler(threading.Thread):
+    """Tracks the peak RSS of each server worker while the load runs."""
+
+    def __init__(self, pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peaks = {}
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            for worker in worker_pids(self.pid):
+                rss = rss_bytes(worker)
+                if rss is not None and rss > self.peaks.get(worker, 0):
+                    self.peaks[worker] = rss
+            self._stopped.wait(self.interval)
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def start_server(args, directory):
+    """Start the app on a free local port with everything it writes in directory."""
+    env = dict(os.environ)
+    env.update({
+        'INTELLINET_SECRET_KEY': 'load-test',
+        'INTELLINET_SESSION_DB': os.path.join(directory, 'sessions.sqlite3'),
+        'INTELLINET_SITE_DB': os.path.join(directory, 'sites.sqlite3'),
+        'INTELLINET_JOB_DB': os.path.join(directory, 'jobs.sqlite3'),
+        'INTELLINET_ARTIFACT_DIR': os.path.join(directory, 'artifacts'),
+        'INTELLINET_BUNDLE_DIR': os.path.join(directory, 'bundles'),
+        'INTELLINET_UPLOAD_DIR': os.path.join(directory, 'uploads'),
+        'INTELLINET_TEMPLATE_CACHE_DIR': os.path.join(directory, 'jinja_cache'),
+        'INTELLINET_EXTRACT_SLOT_DIR': os.path.join(directory, 'extract_slots'),
+    })
+    if not args.cache:
+        # Every upload is really parsed, although the corpus repeats pages.
+        env['INTELLINET_EXTRACTION_CACHE_BYTES'] = '0'
+
+    port = free_port()
+    if args.server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '--workers', str(args.workers), '--threads', str(args.threads),
+                   '--bind', f"127.0.0.1:{port}", '--timeout', str(int(args.timeout)), 'app:app']
+    else:
+        command = [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', str(port), '--with-threads']
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"{' '.join(command[1:4])} exited with status {process.returncode}")
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/')
+            connection.getresponse().read()
+            connection.close()
+            return process, url
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    sys.exit(f"The server did not answer within {STARTUP_TIMEOUT} seconds.")
+
+
+def summarize(recorder, elapsed, peaks):
+    routes = {}
+    requests = 0
+    for route in ROUTES:
+        ordered = sorted(recorder.latencies[route])
+        errors = sum(recorder.errors[route].values())
+        requests += len(ordered)
+        routes[route] = {
+            'requests': len(ordered),
+            'errors': errors,
+            'error_rate': errors / len(ordered) if ordered else 0.0,
+            'error_kinds': dict(recorder.errors[route]),
+            **{f"p{percent}": percentile(ordered, percent) for percent in PERCENTILES},
+        }
+    flows = recorder.flows + recorder.failed_flows
+    return {
+        'elapsed': elapsed,
+        'flows': recorder.flows,
+        'failed_flows': recorder.failed_flows,
+        'flow_error_rate': recorder.failed_flows / flows if flows else 0.0,
+        'flows_per_second': recorder.flows / elapsed,
+        'requests_per_second': requests / elapsed,
+        'routes': routes,
+        'worker_peak_rss': {str(pid): rss for pid, rss in sorted(peaks.items())},
+    }
+
+
+def print_report(report):
+    def ms(seconds):
+        return '-' if seconds is None else f"{seconds * 1000:.1f}"
+
+    print(f"{'route':<10} {'requests':>9} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for route, stats in report['routes'].items():
+        print(f"{route:<10} {stats['requests']:>9} {stats['errors']:>7} "
+              f"{ms(stats['p50']):>9} {ms(stats['p95']):>9} {ms(stats['p99']):>9}")
+        for kind, count in sorted(stats['error_kinds'].items()):
+            print(f"{'':<10} {count:>9} x {kind}")
+    print(f"\n{report['flows']} flows completed, {report['failed_flows']} failed "
+          f"({report['flow_error_rate']:.1%}) in {report['elapsed']:.1f} s")
+    print(f"{report['flows_per_second']:.2f} flows/s, {report['requests_per_second']:.2f} requests/s")
+    if report['worker_peak_rss']:
+        peaks = ', '.join(f"{rss / 1024 / 1024:.0f} MiB" for rss in report['worker_peak_rss'].values())
+        print(f"Peak worker RSS: {peaks}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='load an already running server instead of starting one')
+    parser.add_argument('--server', choices=['gunicorn', 'flask'], default='gunicorn',
+                        help='how to start the server when no --url is given')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=1, help='threads per gunicorn worker')
+    parser.add_argument('--pid', type=int, help='with --url, the server process to sample RSS from')
+    parser.add_argument('--users', type=int, default=10, help='concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to run the load for')
+    parser.add_argument('--ramp-up', type=float, default=0, help='seconds over which the users start')
+    parser.add_argument('--mix', default='10k:80,100k:20', help='page sizes and their weights, as size:weight')
+    parser.add_argument('--files', type=int, default=1, help='pages per upload')
+    parser.add_argument('--pages', type=int, default=4, help='distinct pages generated per size')
+    parser.add_argument('--select', type=int, default=20, help='components selected per flow')
+    parser.add_argument('--cache', action='store_true', help='keep the extraction cache on')
+    parser.add_argument('--timeout', type=float, default=120, help='seconds before a request fails')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the report as JSON to this file')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    corpus = {
+        label: [generate_page(size, seed=args.seed + page, **DEFAULTS) for page in range(args.pages)]
+        for label, size, _ in mix
+    }
+
+    scratch = None
+    process = None
+    if args.url:
+        url = args.url.rstrip('/')
+        pid = args.pid
+    else:
+        scratch = tempfile.TemporaryDirectory()
+        process, url = start_server(args, scratch.name)
+        pid = process.pid
+
+    sampler = None
+    if pid is not None:
+        sampler = RssSampler(pid)
+        sampler.start()
+
+    recorder = Recorder()
+    started = time.monotonic()
+    deadline = started + args.ramp_up + args.duration
+    users = [
+        threading.Thread(target=run_user, args=(url, corpus, mix, args, recorder, args.seed * 1000 + number,
+                                                started + args.ramp_up * number / args.users, deadline))
+        for number in range(args.users)
+    ]
+    try:
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+    finally:
+        elapsed = time.monotonic() - started
+        if sampler is not None:
+            sampler.stop()
+        if process is not None:
+            process.terminate()
+            process.wait()
+        if scratch is not None:
+            scratch.cleanup()
+
+    report = summarize(recorder, elapsed, sampler.peaks if sampler is not None else {})
+    report['meta'] = {
+        'url': args.url,
+        'server': None if args.url else args.server,
+        'workers': None if args.url else args.workers,
+        'users': args.users,
+        'duration': args.duration,
+        'mix': args.mix,
+        'files': args.files,
+        'select': args.select,
+        'seed': args.seed,
+    }
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
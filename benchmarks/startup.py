@@ -0,0 +1,89 @@
+"""
+Measure how long a fresh worker takes to import the app and serve its
+first request.
+
+Each scenario runs in new interpreters so nothing is shared between runs:
+
+  cold   empty template bytecode cache, as on a brand new host
+  warm   bytecode cache already populated, as on every later boot
+  eager  warm, but bs4 and the process pool machinery imported up front,
+         the way the app used to load them
+
+Usage: python benchmarks/startup.py [--runs 10] [--output startup.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, os, sys, time
+start = time.perf_counter()
+if os.environ.get('STARTUP_EAGER'):
+    import bs4, concurrent.futures.process
+import app
+imported = time.perf_counter()
+app.app.test_client().get('/')
+served = time.perf_counter()
+print(json.dumps({
+    'import_s': imported - start,
+    'first_request_s': served - imported,
+    'total_s': served - start,
+    'bs4_loaded': 'bs4' in sys.modules,
+}))
+"""
+
+
+def run_once(template_cache_dir, eager):
+    env = dict(os.environ, INTELLINET_TEMPLATE_CACHE_DIR=template_cache_dir)
+    if eager:
+        env['STARTUP_EAGER'] = '1'
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD], cwd=ROOT, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(samples):
+    summary = {}
+    for key in ('import_s', 'first_request_s', 'total_s'):
+        values = [sample[key] for sample in samples]
+        summary[key] = {'median': statistics.median(values), 'min': min(values), 'max': max(values)}
+    summary['bs4_loaded'] = samples[0]['bs4_loaded']
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    results = {'cold': [], 'warm': [], 'eager': []}
+    with tempfile.TemporaryDirectory() as warm_dir:
+        # Also makes sure .pyc files exist, so every scenario measures the same thing.
+        run_once(warm_dir, eager=False)
+        for _ in range(args.runs):
+            with tempfile.TemporaryDirectory() as cold_dir:
+                results['cold'].append(run_once(cold_dir, eager=False))
+            results['warm'].append(run_once(warm_dir, eager=False))
+            results['eager'].append(run_once(warm_dir, eager=True))
+
+    report = {scenario: summarize(samples) for scenario, samples in results.items()}
+    for scenario, summary in report.items():
+        print(f"{scenario:>5}: import {summary['import_s']['median'] * 1000:7.1f} ms, "
+              f"first request {summary['first_request_s']['median'] * 1000:6.1f} ms, "
+              f"total {summary['total_s']['median'] * 1000:7.1f} ms, bs4 loaded: {summary['bs4_loaded']}")
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+"""
+Benchmark extraction, id lookup, script generation and the whole
+upload -> select -> generate flow on synthetic pages from corpus.py.
+
+Every benchmark reports the median, minimum and maximum of its runs. With
+--baseline, the run fails (exit status 1) when any benchmark's median is more
+than --threshold slower than in the baseline file, so CI can catch
+regressions:
+
+    python benchmarks/suite.py --output baseline.json
+    python benchmarks/suite.py --baseline baseline.json --threshold 0.2
+
+Usage: python benchmarks/suite.py [--sizes 10k,1m,10m] [--runs 5] [--only extract]
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from corpus import DEFAULTS, generate_page, parse_size  # noqa: E402
+
+DEFAULT_SIZES = '10k,1m,10m'
+COMPONENT_COUNTS = (10, 100, 1000)
+# Fewer runs for pages this large, which take seconds each.
+LARGE_PAGE = 8 * 1024 * 1024
+# Slowdowns smaller than this many seconds are timer noise, not regressions.
+NOISE_FLOOR = 0.0005
+
+
+def measure(function, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return {'median': statistics.median(timings), 'min': min(timings), 'max': max(timings), 'runs': runs}
+
+
+def runs_for(size, runs):
+    return min(runs, 2) if size >= LARGE_PAGE else runs
+
+
+def isolate_app(directory):
+    """
+    Point everything the app writes at a scratch directory and turn off the
+    extraction cache, so every upload is really parsed. Must run before the
+    app is imported.
+    """
+    os.environ.update({
+        'INTELLINET_SECRET_KEY': 'benchmark',
+        'INTELLINET_SESSION_BACKEND': 'memory',
+        'INTELLINET_SITE_BACKEND': 'memory',
+        'INTELLINET_ARTIFACT_DIR': os.path.join(directory, 'artifacts'),
+        'INTELLINET_BUNDLE_DIR': os.path.join(directory, 'bundles'),
+        'INTELLINET_UPLOAD_DIR': os.path.join(directory, 'uploads'),
+        'INTELLINET_TEMPLATE_CACHE_DIR': os.path.join(directory, 'jinja_cache'),
+        'INTELLINET_EXTRACT_SLOT_DIR': os.path.join(directory, 'extract_slots'),
+        'INTELLINET_EXTRACTION_CACHE_BYTES': '0',
+        'INTELLINET_MAX_UPLOAD_BYTES': str(1024 * 1024 * 1024),
+        'INTELLINET_MAX_FILE_BYTES': str(512 * 1024 * 1024),
+        'INTELLINET_MAX_ELEMENTS': str(10 ** 8),
+    })
+
+
+def bench_extract(pages, runs, results):
+    from extractor import extract_elements
+    try:
+        import bs4  # noqa: F401
+        modes = ('stream', 'soup')
+    except ImportError:
+        modes = ('stream',)
+
+    for label, html_content in pages.items():
+        for mode in modes:
+            results[f"extract.{mode}.{label}"] = measure(
+                lambda: extract_elements(html_content, mode=mode), runs_for(len(html_content), runs)
+            )
+
+
+def bench_id_lookup(pages, runs, results):
+    from extractor import build_id_index, extract_elements, share_elements
+    for label, html_content in pages.items():
+        elements_data, references = share_elements([extract_elements(html_content)])
+        id_index, _ = build_id_index(elements_data, references)
+        ids = list(id_index)
+        random.Random(0).shuffle(ids)
+        results[f"id_index.{label}"] = measure(lambda: build_id_index(elements_data, references), runs)
+        results[f"id_lookup.{label}"] = measure(lambda: [id_index.get(element_id) for element_id in ids], runs)
+
+
+def components(count):
+    rng = random.Random(count)
+    selected = []
+    for position in range(count):
+        tag = rng.choice(['button', 'a', 'nav-a'])
+        component = {'id': f"{tag}-{position}", 'text': f"item {position}", 'tag': tag,
+                     'name': f"{rng.choice(['open', 'show', 'go'])} item {position}"}
+        if tag != 'button':
+            component['href'] = f"#section-{position}"
+        selected.append(component)
+    return selected
+
+
+def bench_generate(runs, results):
+    from jsgen import generate_js_code
+    for count in COMPONENT_COUNTS:
+        selected = components(count)
+        results[f"generate_js.{count}"] = measure(lambda: generate_js_code(selected), runs)
+
+
+def bench_end_to_end(pages, runs, results, max_selected=200):
+    from app import app
+    client = app.test_client()
+
+    for label, html_content in pages.items():
+        def upload():
+            response = client.post('/process', data={'htmlfiles': [(io.BytesIO(html_content), 'page.html')]},
+                                   content_type='multipart/form-data')
+            assert response.status_code == 302, response.status_code
+
+        def select():
+            response = client.get('/select-components')
+            assert response.status_code == 200, response.status_code
+            response = client.get('/select-components/elements', query_string={'limit': max_selected})
+            assert response.status_code == 200, response.status_code
+            return response.get_json()
+
+        def search():
+            response = client.get('/select-components/elements', query_string={'q': 'search', 'offset': 100})
+            assert response.status_code == 200, response.status_code
+
+        page_runs = runs_for(len(html_content), runs)
+        results[f"e2e.process.{label}"] = measure(upload, page_runs)
+        results[f"e2e.select.{label}"] = measure(select, page_runs)
+        results[f"e2e.search.{label}"] = measure(search, page_runs)
+
+        ids = [item['id'] for item in select()['items']]
+        form = {'components': ids}
+        for element_id in form['components']:
+            form[f"names[{element_id}]"] = f"command {element_id}"
+
+        def generate():
+            response = client.post('/generate', data=form)
+            assert response.status_code == 200, response.status_code
+
+        results[f"e2e.generate.{label}"] = measure(generate, page_runs)
+
+
+def compare(results, baseline, threshold):
+    """Return a line for every benchmark whose median regressed by more than threshold."""
+    regressions = []
+    for name, result in sorted(results.items()):
+        before = baseline.get(name)
+        if before is None or not before['median']:
+            continue
+        ratio = result['median'] / before['median']
+        if ratio > 1 + threshold and result['median'] - before['median'] > NOISE_FLOOR:
+            regressions.append(f"{name}: {before['median'] * 1000:.2f} ms -> {result['median'] * 1000:.2f} ms "
+                               f"({(ratio - 1) * 100:+.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='comma-separated page sizes, up to 50m')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', choices=['extract', 'id', 'generate', 'e2e'], action='append',
+                        help='run only these groups (repeatable)')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown against the baseline')
+    args = parser.parse_args()
+
+    groups = set(args.only or ['extract', 'id', 'generate', 'e2e'])
+    scratch = tempfile.TemporaryDirectory()
+    isolate_app(scratch.name)
+
+    pages = {}
+    for size_text in args.sizes.split(','):
+        pages[size_text.strip()] = generate_page(parse_size(size_text), seed=args.seed, **DEFAULTS)
+
+    results = {}
+    if 'extract' in groups:
+        bench_extract(pages, args.runs, results)
+    if 'id' in groups:
+        bench_id_lookup(pages, args.runs, results)
+    if 'generate' in groups:
+        bench_generate(args.runs, results)
+    if 'e2e' in groups:
+        bench_end_to_end(pages, args.runs, results)
+    scratch.cleanup()
+
+    for name, result in results.items():
+        print(f"{name:<32} median {result['median'] * 1000:10.2f} ms   min {result['min'] * 1000:10.2f} ms")
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'sizes': {label: len(html_content) for label, html_content in pages.items()},
+            'runs': args.runs,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmarks regressed by more than {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.threshold:.0%} against {args.baseline}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+import gzip
+import hashlib
+import os
+import re
+
+from store import write_atomic
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; bundles are then served as gzip only
+    brotli = None
+
+# Strings, comments, whitespace and everything else, in the order they are
+# tried. The generated script contains no regular expression literals, so a
+# '/' is always a comment start or an operator.
+TOKEN_RE = re.compile(r'''
+    (?P<string>'(?:\\.|[^'\\\n])*'|"(?:\\.|[^"\\\n])*"|`(?:\\.|[^`\\])*`)
+  | (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<space>\s+)
+  | (?P<code>[^'"`/\s]+|/)
+''', re.S | re.X)
+
+IDENTIFIER_CHARS = re.compile(r'[\w$]')
+
+BUNDLE_HASH = re.compile(r'^[0-9a-f]{20}$')
+
+ENCODINGS = {
+    'br': '.br',
+    'gzip': '.gz',
+    'identity': '',
+}
+
+
+def minify_js(js_code):
+    """
+    Strip comments and redundant whitespace from code produced by
+    generate_js_code. Line breaks are kept wherever automatic semicolon
+    insertion could depend on them.
+    """
+    tokens = []
+    for match in TOKEN_RE.finditer(js_code):
+        kind = match.lastgroup
+        if kind == 'comment':
+            # A comment still separates the tokens around it.
+            tokens.append(('space', '\n' if match.group().startswith('//') else ' '))
+        else:
+            tokens.append((kind, match.group()))
+
+    output = []
+    for position, (kind, text) in enumerate(tokens):
+        if kind != 'space':
+            output.append(text)
+            continue
+        if not output or position + 1 == len(tokens):
+            continue
+        before = output[-1][-1]
+        after = tokens[position + 1][1][:1]
+        if after.isspace():
+            # Merge runs of whitespace and comments into the next one.
+            if '\n' in text:
+                tokens[position + 1] = ('space', '\n')
+            continue
+        if '\n' in text and before not in ';,{([' and after not in ';,})]:.?':
+            output.append('\n')
+        elif IDENTIFIER_CHARS.match(before) and IDENTIFIER_CHARS.match(after):
+            output.append(' ')
+        elif before in '+-' and after == before:
+            output.append(' ')
+    return ''.join(output)
+
+
+def bundle_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:20]
+
+
+class BundleStore:
+    """
+    Content-addressed store of minified scripts and JSON command tables with
+    precompressed gzip and brotli variants. A bundle's name is the hash of
+    its content, so identical command sets share one bundle and a published
+    bundle never changes.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, digest, encoding, extension='.js'):
+        return os.path.join(self.directory, digest + extension + ENCODINGS[encoding])
+
+    def publish(self, js_code):
+        return self._publish(minify_js(js_code), '.js')
+
+    def publish_json(self, json_text):
+        return self._publish(json_text, '.json')
+
+    def _publish(self, text, extension):
+        digest = bundle_hash(text)
+        if os.path.exists(self._path(digest, 'identity', extension)):
+            return digest
+
+        data = text.encode('utf-8')
+        variants = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants['br'] = brotli.compress(data, mode=brotli.MODE_TEXT)
+        # The plain file is written last: its presence marks a complete bundle.
+        variants['identity'] = data
+        for encoding, payload in variants.items():
+            write_atomic(self._path(digest, encoding, extension), payload)
+        return digest
+
+    def load(self, digest, accepted_encodings, extension='.js'):
+        """
+        Return (encoding, payload) for the best variant the client accepts,
+        or None if there is no such bundle.
+        """
+        if not BUNDLE_HASH.match(digest):
+            return None
+        for encoding in ('br', 'gzip', 'identity'):
+            if encoding != 'identity' and encoding not in accepted_encodings:
+                continue
+            try:
+                with open(self._path(digest, encoding, extension), 'rb') as bundle_file:
+                    return encoding, bundle_file.read()
+            except FileNotFoundError:
+                continue
+        return None
@@ -0,0 +1,116 @@
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import threading
+
+from store import write_atomic
+
+# Bump when the shape of extracted elements changes so stale entries on disk
+# are never returned. Version 2 derives ids from content instead of uuid4;
+# version 3 makes those ids 64 bits long.
+CACHE_VERSION = 3
+
+
+class ExtractionCache:
+    """
+    Content-addressed cache of extraction results.
+
+    Entries are keyed by a hash of the uploaded bytes and stored as compact
+    JSON. The memory tier is an LRU bounded by the total size of the stored
+    JSON; the optional disk tier lives in a directory that every gunicorn
+    worker can share.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(html_content, mode):
+        if isinstance(html_content, str):
+            html_content = html_content.encode('utf-8')
+        digest = hashlib.blake2b(html_content, digest_size=20)
+        digest.update(f"|{mode}|{CACHE_VERSION}".encode('ascii'))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key):
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+                self._counters['hits'] += 1
+                self._counters['memory_hits'] += 1
+                return json.loads(payload)
+
+        if self.directory:
+            try:
+                with open(self._path(key), 'rb') as cache_file:
+                    payload = cache_file.read()
+            except OSError:
+                payload = None
+            if payload is not None:
+                with self._lock:
+                    self._counters['hits'] += 1
+                    self._counters['disk_hits'] += 1
+                    self._remember(key, payload)
+                return json.loads(payload)
+
+        with self._lock:
+            self._counters['misses'] += 1
+        return None
+
+    def put(self, key, elements_data):
+        payload = json.dumps(elements_data, separators=(',', ':')).encode('utf-8')
+        with self._lock:
+            self._remember(key, payload)
+        if self.directory:
+            self._write(key, payload)
+
+    def _remember(self, key, payload):
+        if len(payload) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= len(previous)
+        self._entries[key] = payload
+        self._bytes += len(payload)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self._counters['evictions'] += 1
+
+    def _write(self, key, payload):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Readers in other workers only ever see complete files.
+            write_atomic(path, payload)
+        except OSError as e:
+            print(f"Error: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['misses']
+            return {
+                **self._counters,
+                'hit_ratio': self._counters['hits'] / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'disk': bool(self.directory),
+            }
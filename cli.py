@@ -0,0 +1,271 @@
+"""
+Build a voice navigation script for a whole static site export.
+
+Walks SITE_DIR, extracts buttons and anchors from every .html/.htm file with
+the same rules as the upload form, names them with a rules file instead of
+the selection checkboxes, and writes manifest.json and generated_code.js,
+plus the same script split into runtime.js and commands.json.
+
+A rules file is JSON:
+
+    {"rules": [
+        {"tag": "nav-a", "name": "{text}"},
+        {"tag": "button", "text": "Sign*", "name": "sign in"},
+        {"id": "search-*", "name": "search"}
+    ]}
+
+Every element is checked against the rules in order and the first match
+names it. Rules may match on tag, id, text and href with shell-style
+wildcards; name is a template that can use {id}, {text}, {href} and {tag}.
+Elements that match no rule, or whose name comes out empty, are skipped.
+
+Progress is checkpointed to OUTPUT_DIR/checkpoint.jsonl; run again with
+--resume to skip pages that were already extracted and have not changed.
+
+Usage: python cli.py SITE_DIR --rules rules.json --output build/
+"""
+from concurrent.futures import ProcessPoolExecutor
+from fnmatch import fnmatchcase
+from string import Formatter
+import argparse
+import json
+import mmap
+import os
+import sys
+import time
+
+from archive import is_html
+from extractor import empty_elements_data, extract_elements, share_elements, count_elements, TooManyElements
+from jsgen import RUNTIME, embed_command_table, generate_command_table
+from store import write_atomic
+
+RULE_FIELDS = ('tag', 'id', 'text', 'href')
+CHECKPOINT_NAME = 'checkpoint.jsonl'
+
+
+def find_pages(site_dir):
+    """Return the relative paths of all HTML pages under site_dir, sorted."""
+    pages = []
+    for directory, subdirectories, filenames in os.walk(site_dir):
+        subdirectories.sort()
+        for filename in filenames:
+            if is_html(filename):
+                pages.append(os.path.relpath(os.path.join(directory, filename), site_dir))
+    return sorted(pages)
+
+
+def extract_page(args):
+    """
+    Return the elements_data of one page, or None if it has more than
+    max_elements. The caller raises for it: an exception here would fail
+    the pool's whole chunk of pages, without saying which one it was.
+    """
+    path, mode, max_elements = args
+    with open(path, 'rb') as page_file:
+        if os.fstat(page_file.fileno()).st_size == 0:
+            return empty_elements_data()
+        with mmap.mmap(page_file.fileno(), 0, access=mmap.ACCESS_READ) as html_content:
+            try:
+                return extract_elements(html_content, mode=mode, max_elements=max_elements)
+            except TooManyElements:
+                return None
+
+
+def page_signature(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def load_checkpoint(path):
+    """
+    Return {page: (signature, elements_data)} from a checkpoint file. A line
+    cut short by an interrupted run is ignored.
+    """
+    done = {}
+    try:
+        with open(path, encoding='utf-8') as checkpoint_file:
+            for line in checkpoint_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                done[entry['page']] = (entry['signature'], entry['elements'])
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def load_rules(path):
+    with open(path, encoding='utf-8') as rules_file:
+        rules = json.load(rules_file)['rules']
+    for rule in rules:
+        if 'name' not in rule:
+            raise ValueError(f"Rule without a name: {rule}")
+        unknown = set(rule) - set(RULE_FIELDS) - {'name'}
+        if unknown:
+            raise ValueError(f"Unknown rule fields {sorted(unknown)} in {rule}")
+        try:
+            placeholders = {field for _, field, _, _ in Formatter().parse(rule['name']) if field is not None}
+        except ValueError as e:
+            raise ValueError(f"Invalid name template {rule['name']!r}: {e}")
+        unknown = placeholders - set(RULE_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown placeholders {sorted(unknown)} in name template {rule['name']!r}; "
+                             f"use {', '.join('{' + field + '}' for field in RULE_FIELDS)}")
+    return rules
+
+
+def name_element(element, rules):
+    for rule in rules:
+        if all(fnmatchcase(element.get(field) or '', rule[field]) for field in RULE_FIELDS if field in rule):
+            values = {'id': element['id'], 'text': element['text'], 'href': element.get('href', ''), 'tag': element['tag']}
+            return rule['name'].format_map(values).strip()
+    return ''
+
+
+def apply_rules(elements_data, rules):
+    """
+    Return the named components, like the selection form would post them.
+    Components that would generate the same command, such as a navbar link
+    repeated on every page, are only kept once.
+    """
+    selected = []
+    seen = set()
+    for category in ('buttons', 'anchors', 'nav_anchors'):
+        for element in elements_data[category]:
+            name = name_element(element, rules)
+            if not name:
+                continue
+            # Navbar commands scroll to their href; the others click by id.
+            target = element.get('href') if element['tag'] == 'nav-a' else element['id']
+            key = (element['tag'], target, name)
+            if key in seen:
+                continue
+            seen.add(key)
+            selected.append({**element, 'name': name})
+    return selected
+
+
+class Progress:
+    def __init__(self, total, interval=1.0, stream=sys.stderr):
+        self.total = total
+        self.interval = interval
+        self.stream = stream
+        self.done = 0
+        self.started = time.perf_counter()
+        self._last_report = 0
+
+    def advance(self, count=1):
+        self.done += count
+        now = time.perf_counter()
+        if now - self._last_report >= self.interval or self.done == self.total:
+            self._last_report = now
+            self.stream.write(f"\r{self.done}/{self.total} pages, {self.rate():.1f} pages/s")
+            self.stream.flush()
+
+    def rate(self):
+        elapsed = time.perf_counter() - self.started
+        return self.done / elapsed if elapsed else 0.0
+
+
+def build(site_dir, rules, output_dir, mode='stream', workers=None, resume=False, max_elements=None, chunksize=16):
+    """
+    Extract every page under site_dir and write the manifest, the script and
+    run statistics to output_dir. Returns the statistics.
+    """
+    started = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    checkpoint_path = os.path.join(output_dir, CHECKPOINT_NAME)
+
+    pages = find_pages(site_dir)
+    signatures = {page: page_signature(os.path.join(site_dir, page)) for page in pages}
+    done = load_checkpoint(checkpoint_path) if resume else {}
+    results = {
+        page: elements for page, (signature, elements) in done.items()
+        if signatures.get(page) == signature
+    }
+    pending = [page for page in pages if page not in results]
+
+    progress = Progress(len(pending))
+
+    with open(checkpoint_path, 'a' if resume else 'w', encoding='utf-8') as checkpoint_file:
+        jobs = [(os.path.join(site_dir, page), mode, max_elements) for page in pending]
+        if workers == 1 or len(pending) < 2:
+            extracted = map(extract_page, jobs)
+            pool = None
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers)
+            extracted = pool.map(extract_page, jobs, chunksize=chunksize)
+        try:
+            for page, elements in zip(pending, extracted):
+                if elements is None:
+                    if progress.done:
+                        sys.stderr.write('\n')
+                    raise TooManyElements(f"{page}: too many elements (more than {max_elements})")
+                results[page] = elements
+                checkpoint_file.write(json.dumps(
+                    {'page': page, 'signature': signatures[page], 'elements': elements},
+                    separators=(',', ':')
+                ) + '\n')
+                progress.advance()
+        finally:
+            checkpoint_file.flush()
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+    extract_seconds = time.perf_counter() - progress.started
+    if pending:
+        sys.stderr.write('\n')
+
+    elements_data, _ = share_elements([results[page] for page in pages])
+    selected = apply_rules(elements_data, rules)
+    write_atomic(os.path.join(output_dir, 'manifest.json'), json.dumps(selected, separators=(',', ':')))
+    command_table = generate_command_table(selected)
+    write_atomic(os.path.join(output_dir, 'generated_code.js'), embed_command_table(command_table))
+    write_atomic(os.path.join(output_dir, 'runtime.js'), RUNTIME)
+    write_atomic(os.path.join(output_dir, 'commands.json'), command_table)
+
+    stats = {
+        'pages': len(pages),
+        'pages_extracted': len(pending),
+        'pages_resumed': len(pages) - len(pending),
+        'elements': count_elements(elements_data),
+        'commands': len(selected),
+        'extract_seconds': extract_seconds,
+        'pages_per_second': len(pending) / extract_seconds if extract_seconds else 0.0,
+        'total_seconds': time.perf_counter() - started,
+    }
+    write_atomic(os.path.join(output_dir, 'stats.json'), json.dumps(stats, indent=2))
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('site_dir', help='directory containing the exported site')
+    parser.add_argument('--rules', required=True, help='JSON file with naming rules')
+    parser.add_argument('--output', required=True, help='directory to write manifest.json and generated_code.js to')
+    parser.add_argument('--workers', type=int, default=None, help='extraction processes (default: one per CPU)')
+    parser.add_argument('--mode', choices=['stream', 'soup'], default='stream', help='extractor to use')
+    parser.add_argument('--max-elements', type=int, default=None, help='fail on pages with more elements than this')
+    parser.add_argument('--resume', action='store_true', help='skip pages already extracted by an earlier run')
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.site_dir):
+        parser.error(f"{args.site_dir} is not a directory")
+    try:
+        rules = load_rules(args.rules)
+    except (OSError, ValueError, KeyError) as e:
+        parser.error(f"Invalid rules file: {e}")
+
+    try:
+        stats = build(args.site_dir, rules, args.output, mode=args.mode, workers=args.workers,
+                      resume=args.resume, max_elements=args.max_elements)
+    except TooManyElements as e:
+        # The pages extracted before it are checkpointed for --resume.
+        parser.exit(1, f"{parser.prog}: error: {e}\n")
+    print(f"{stats['pages']} pages ({stats['pages_resumed']} resumed), {stats['elements']} elements, "
+          f"{stats['commands']} commands, {stats['pages_per_second']:.1f} pages/s, "
+          f"{stats['total_seconds']:.2f} s total")
+
+
+if __name__ == '__main__':
+    main()
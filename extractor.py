@@ -0,0 +1,704 @@
+from html.parser import HTMLParser
+from html.entities import html5
+from contextlib import contextmanager
+import codecs
+import hashlib
+import html
+import io
+import mmap
+import os
+import re
+import threading
+
+# Tags that never hold children, so they are never pushed on the open-tag stack.
+VOID_ELEMENTS = frozenset([
+    'area', 'base', 'basefont', 'bgsound', 'br', 'col', 'command', 'embed',
+    'frame', 'hr', 'image', 'img', 'input', 'isindex', 'keygen', 'link',
+    'menuitem', 'meta', 'nextid', 'param', 'source', 'spacer', 'track', 'wbr',
+])
+
+# Strings inside these tags are not part of an element's visible text.
+STRING_CONTAINERS = frozenset(['rp', 'rt', 'script', 'style', 'template'])
+
+# Inside these tags whitespace-only strings are kept as they are.
+PRESERVE_WHITESPACE = frozenset(['pre', 'textarea'])
+
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+
+# Uploads are decoded and fed to the parser in pieces of this many bytes.
+CHUNK_SIZE = 64 * 1024
+
+XML_ENCODING_RE = re.compile(rb'^\s*<\?.*encoding=[\'"](.*?)[\'"].*\?>', re.I)
+HTML_META_RE = re.compile(rb'<\s*meta[^>]+charset\s*=\s*["\']?([^>]*?)[ /;\'">]', re.I)
+
+BOMS = [
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF32_LE, 'utf-32le'),
+    (codecs.BOM_UTF32_BE, 'utf-32be'),
+    (codecs.BOM_UTF16_LE, 'utf-16le'),
+    (codecs.BOM_UTF16_BE, 'utf-16be'),
+]
+
+
+def empty_elements_data():
+    return {'buttons': [], 'anchors': [], 'nav_anchors': []}
+
+
+class TooManyElements(Exception):
+    """Raised when an upload yields more elements than the configured limit."""
+
+
+def sniff_encodings(html_content):
+    """
+    Return the offset where the markup starts after any byte order mark and
+    the encodings to try, in the order BeautifulSoup would: BOM, then the
+    declared charset, then UTF-8, then Windows-1252.
+
+    html_content may be any bytes-like object, including a memory map.
+    """
+    offset = 0
+    candidates = []
+    head = bytes(html_content[:4])
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            offset = len(bom)
+            candidates.append(encoding)
+            break
+
+    declared = XML_ENCODING_RE.search(html_content, offset, offset + 1024)
+    if not declared:
+        declared = HTML_META_RE.search(html_content, offset, offset + max(2048, int(len(html_content) * 0.05)))
+    if declared and declared.group(1):
+        candidates.append(declared.group(1).decode('ascii', 'replace').lower())
+
+    return offset, candidates + ['utf-8', 'windows-1252']
+
+
+class StableIds:
+    """
+    Gives elements without an id attribute one derived from where they sit
+    and what they contain: their tag path from the root, their text, their
+    href, and how many identical elements came before them. Re-uploading the
+    same page therefore yields the same ids, and editing one part of a page
+    leaves the ids elsewhere untouched.
+    """
+
+    def __init__(self):
+        self._occurrences = {}
+        self._used = set()
+
+    def assign(self, prefix, path, text, href=None):
+        key = '\x1f'.join([prefix, path, text, href or ''])
+        occurrence = self._occurrences.get(key, 0)
+        self._occurrences[key] = occurrence + 1
+        while True:
+            digest = hashlib.blake2b(f"{key}\x1f{occurrence}".encode('utf-8'), digest_size=8).hexdigest()
+            element_id = f"{prefix}-{digest}"
+            # 64 bits keep ids unique across the pages of a site, where
+            # collisions cannot be seen; within a page, two elements whose
+            # digests collide still get distinct ids.
+            if element_id not in self._used:
+                break
+            occurrence += 1
+        self._used.add(element_id)
+        return element_id
+
+
+class ElementExtractor(HTMLParser):
+    """
+    Event-driven extractor that collects buttons, standalone anchors and
+    navbar anchors in a single pass over the markup.
+
+    Only a stack of open tag names is kept, plus one record per element that
+    is still open, so memory does not grow with the size of the document.
+    Tag nesting, entity handling and whitespace rules follow BeautifulSoup's
+    html.parser tree builder, which keeps the output identical to the
+    find_all based extraction.
+    """
+
+    def __init__(self, elements_data=None, max_elements=None):
+        super().__init__(convert_charrefs=False)
+        self.elements_data = elements_data if elements_data is not None else empty_elements_data()
+        self.max_elements = max_elements
+        self._count = 0
+        self._stack = []
+        self._capturing = []
+        self._pending = []
+        self._container_depth = 0
+        self._preserve_depth = 0
+        self._open_navs = []
+        self._nav_count = 0
+        self._nav_buckets = {}
+        self._closed_voids = {}
+        self._ids = StableIds()
+
+    # -- text handling ------------------------------------------------------
+
+    def _flush(self, included=None):
+        if not self._pending:
+            return
+        data = ''.join(self._pending)
+        self._pending = []
+        if not self._capturing:
+            return
+        if included is None:
+            included = self._container_depth == 0
+        if not included:
+            return
+        if not self._preserve_depth and not data.strip(ASCII_SPACES):
+            data = '\n' if '\n' in data else ' '
+        for record in self._capturing:
+            record[1].append(data)
+
+    def handle_data(self, data):
+        self._pending.append(data)
+
+    def handle_entityref(self, name):
+        character = html5.get(name + ';')
+        self._pending.append(character if character is not None else f"&{name}")
+
+    def handle_charref(self, name):
+        match = re.match(r'(x[0-9a-f]+|[0-9]+)(.*)', name, re.I | re.S)
+        if match is None:
+            self._pending.append(name)
+            return
+        self._pending.append(html.unescape(f"&#{match.group(1)};"))
+        self._pending.append(match.group(2))
+
+    def handle_comment(self, data):
+        self._flush()
+
+    def handle_decl(self, decl):
+        self._flush()
+
+    def handle_pi(self, data):
+        self._flush()
+
+    def unknown_decl(self, data):
+        self._flush()
+        if data.upper().startswith('CDATA['):
+            self._pending.append(data[len('CDATA['):])
+            self._flush(included=True)
+
+    # -- tag handling -------------------------------------------------------
+
+    def handle_starttag(self, tag, attrs):
+        self._flush()
+        if tag in VOID_ELEMENTS:
+            # A later explicit end tag for this void element is swallowed
+            # without ending the current string, as BeautifulSoup does.
+            self._closed_voids[tag] = self._closed_voids.get(tag, 0) + 1
+            return
+        self._push(tag, attrs)
+
+    def handle_startendtag(self, tag, attrs):
+        self._flush()
+        self._push(tag, attrs)
+        self._pop_to(tag)
+
+    def handle_endtag(self, tag):
+        if self._closed_voids.get(tag):
+            self._closed_voids[tag] -= 1
+            return
+        self._flush()
+        self._pop_to(tag)
+
+    def _push(self, tag, attrs):
+        attributes = {key: '' if value is None else value for key, value in attrs}
+        record = None
+
+        # Ids that are not in the markup are derived once the element's text
+        # is known, when it is popped.
+        if tag == 'button':
+            element = {'id': attributes.get('id'), 'text': '', 'tag': 'button'}
+            self.elements_data['buttons'].append(element)
+            record = (element, [], 'btn', self._path())
+        elif tag == 'a' and 'href' in attributes:
+            if self._open_navs:
+                element = {
+                    'id': attributes.get('id'),
+                    'text': '',
+                    'href': attributes['href'],
+                    'tag': 'nav-a'
+                }
+                # An anchor inside nested navs is listed once for every
+                # enclosing nav, in nav order, exactly like nav.find_all('a').
+                for nav in self._open_navs:
+                    self._nav_buckets[nav].append(element)
+                record = (element, [], 'nav-a', self._path())
+            else:
+                element = {
+                    'id': attributes.get('id'),
+                    'text': '',
+                    'href': attributes['href'],
+                    'tag': 'a'
+                }
+                self.elements_data['anchors'].append(element)
+                record = (element, [], 'a', self._path())
+        elif tag == 'nav':
+            self._nav_buckets[self._nav_count] = []
+            self._open_navs.append(self._nav_count)
+            self._nav_count += 1
+
+        if record is not None:
+            self._capturing.append(record)
+            self._count += len(self._open_navs) if tag == 'a' and self._open_navs else 1
+            if self.max_elements is not None and self._count > self.max_elements:
+                raise TooManyElements(f"More than {self.max_elements} elements found in one upload.")
+        if tag in STRING_CONTAINERS:
+            self._container_depth += 1
+        if tag in PRESERVE_WHITESPACE:
+            self._preserve_depth += 1
+        self._stack.append((tag, record))
+
+    def _path(self):
+        return '>'.join(tag for tag, _ in self._stack)
+
+    def _pop_to(self, tag):
+        for position in range(len(self._stack) - 1, -1, -1):
+            if self._stack[position][0] == tag:
+                break
+        else:
+            return
+        while len(self._stack) > position:
+            self._pop()
+
+    def _pop(self):
+        tag, record = self._stack.pop()
+        if record is not None:
+            self._capturing.pop()
+            element, parts, prefix, path = record
+            element['text'] = ''.join(parts).strip()
+            if element['id'] is None:
+                element['id'] = self._ids.assign(prefix, path, element['text'], element.get('href'))
+        if tag == 'nav':
+            self._open_navs.pop()
+        if tag in STRING_CONTAINERS:
+            self._container_depth -= 1
+        if tag in PRESERVE_WHITESPACE:
+            self._preserve_depth -= 1
+
+    def close(self):
+        super().close()
+        self._flush()
+        while self._stack:
+            self._pop()
+        for nav in sorted(self._nav_buckets):
+            self.elements_data['nav_anchors'].extend(dict(element) for element in self._nav_buckets[nav])
+        self._nav_buckets = {}
+        return self.elements_data
+
+
+class AnnotatingExtractor(ElementExtractor):
+    """
+    ElementExtractor that also records where the ids it derives belong in
+    the markup: for every element without an id attribute, the offset in
+    the decoded document right after its tag name, with the element.
+    """
+
+    def __init__(self, elements_data=None, max_elements=None):
+        super().__init__(elements_data, max_elements)
+        self.insertions = []
+        self._fed = 0
+        self._base = 0
+        self._tag_start = 0
+
+    # HTMLParser keeps unparsed markup in self.rawdata between feeds; _base
+    # is the offset in the whole document of its first character.
+
+    def feed(self, data):
+        self._base = self._fed - len(self.rawdata)
+        self._fed += len(data)
+        super().feed(data)
+
+    def close(self):
+        self._base = self._fed - len(self.rawdata)
+        return super().close()
+
+    def parse_starttag(self, i):
+        self._tag_start = self._base + i
+        return super().parse_starttag(i)
+
+    def _push(self, tag, attrs):
+        super()._push(tag, attrs)
+        record = self._stack[-1][1]
+        if record is not None and record[0]['id'] is None:
+            self.insertions.append((self._tag_start + 1 + len(tag), tag, record[0]))
+
+
+def extract_with_soup(html_content, elements_data, max_elements=None):
+    """
+    Extract elements by building a full BeautifulSoup tree. Kept as a
+    reference implementation for the streaming extractor.
+    """
+    # bs4 is only imported when this mode is used, to keep worker boot fast.
+    from bs4 import BeautifulSoup
+
+    if not isinstance(html_content, (str, bytes)):
+        html_content = bytes(html_content)
+    soup = BeautifulSoup(html_content, 'html.parser')
+    ids = StableIds()
+
+    def path(tag):
+        return '>'.join(reversed([parent.name for parent in tag.parents if parent is not soup]))
+
+    for btn in soup.find_all('button'):
+        btn_text = btn.text.strip()
+        btn_id = btn.get('id')
+        if btn_id is None:
+            btn_id = ids.assign('btn', path(btn), btn_text)
+        btn['id'] = btn_id
+        elements_data['buttons'].append({'id': btn_id, 'text': btn_text, 'tag': 'button'})
+
+    for anchor in soup.find_all('a', href=True):
+        parent_nav = anchor.find_parent('nav')
+        if not parent_nav:
+            anchor_text = anchor.text.strip()
+            anchor_id = anchor.get('id')
+            if anchor_id is None:
+                anchor_id = ids.assign('a', path(anchor), anchor_text, anchor['href'])
+            anchor['id'] = anchor_id
+            elements_data['anchors'].append({
+                'id': anchor_id,
+                'text': anchor_text,
+                'href': anchor['href'],
+                'tag': 'a'
+            })
+
+    for nav in soup.find_all('nav'):
+        for nav_anchor in nav.find_all('a', href=True):
+            nav_anchor_id = nav_anchor.get('id')
+            if nav_anchor_id is None:
+                nav_anchor_id = ids.assign('nav-a', path(nav_anchor), nav_anchor.text.strip(), nav_anchor['href'])
+            nav_anchor['id'] = nav_anchor_id
+            elements_data['nav_anchors'].append({
+                'id': nav_anchor_id,
+                'text': nav_anchor.text.strip(),
+                'href': nav_anchor['href'],
+                'tag': 'nav-a'
+            })
+
+    check_element_count(elements_data, max_elements)
+    return elements_data
+
+
+def feed_decoded(html_content, make_extractor):
+    """
+    Feed html_content to an extractor from make_extractor() in CHUNK_SIZE
+    pieces, decoding each piece incrementally, so the document is never
+    held as one string.
+
+    Returns the extractor, not yet closed, with the encoding and error
+    handler the document was decoded with and the offset its markup starts
+    at.
+    """
+    offset, encodings = sniff_encodings(html_content)
+    with memoryview(html_content) as view:
+        for encoding in encodings:
+            # A document that turns out not to be valid in this encoding is
+            # parsed again from the start with the next candidate.
+            extractor = make_extractor()
+            try:
+                decoder = codecs.getincrementaldecoder(encoding)()
+                for start in range(offset, len(view), CHUNK_SIZE):
+                    extractor.feed(decoder.decode(view[start:start + CHUNK_SIZE]))
+                extractor.feed(decoder.decode(b'', final=True))
+            except (LookupError, UnicodeDecodeError):
+                continue
+            return extractor, encoding, 'strict', offset
+
+        extractor = make_extractor()
+        decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        for start in range(offset, len(view), CHUNK_SIZE):
+            extractor.feed(decoder.decode(view[start:start + CHUNK_SIZE]))
+        extractor.feed(decoder.decode(b'', final=True))
+        return extractor, 'utf-8', 'replace', offset
+
+
+def extract_with_stream(html_content, elements_data, max_elements=None):
+    """Extract elements with an ElementExtractor fed by feed_decoded()."""
+    if isinstance(html_content, str):
+        extractor = ElementExtractor(max_elements=max_elements)
+        extractor.feed(html_content)
+        return merge_elements_data(elements_data, [extractor.close()])
+
+    extractor, _, _, _ = feed_decoded(html_content, lambda: ElementExtractor(max_elements=max_elements))
+    return merge_elements_data(elements_data, [extractor.close()])
+
+
+def id_insertions(html_content):
+    """
+    Return the encoding of html_content and, in document order, the
+    (byte offset, id) of every element that has no id attribute: where to
+    insert the id extraction gave it.
+
+    The parser works on decoded text, so the offsets it records are mapped
+    back to bytes by decoding the document a second time. Where that is not
+    exact, as in a document with invalid UTF-8, an offset that does not
+    land right after the element's tag name is dropped.
+    """
+    extractor, encoding, errors, offset = feed_decoded(html_content, AnnotatingExtractor)
+    extractor.close()
+    pending = sorted((position, tag, element['id']) for position, tag, element in extractor.insertions)
+
+    insertions = []
+    decoder = codecs.getincrementaldecoder(encoding)(errors)
+    chars = 0
+    index = 0
+    with memoryview(html_content) as view:
+        starts = range(offset, len(view), CHUNK_SIZE)
+        for start in [*starts, len(view)]:
+            buffered = len(decoder.getstate()[0])
+            final = start == len(view)
+            text = decoder.decode(view[start:start + CHUNK_SIZE], final=final)
+            # The bytes the decoder held back from the previous piece are
+            # the start of this text.
+            byte_position = start - buffered
+            decoded = 0
+            while index < len(pending) and pending[index][0] < chars + len(text):
+                position, tag, element_id = pending[index]
+                byte_position += len(text[decoded:position - chars].encode(encoding, errors))
+                decoded = position - chars
+                opening = f"<{tag}".encode(encoding)
+                if bytes(view[byte_position - len(opening):byte_position]).lower() == opening:
+                    insertions.append((byte_position, element_id))
+                index += 1
+            chars += len(text)
+    return encoding, insertions
+
+
+def count_elements(elements_data):
+    return sum(len(elements) for elements in elements_data.values())
+
+
+def check_element_count(elements_data, max_elements):
+    if max_elements is not None and count_elements(elements_data) > max_elements:
+        raise TooManyElements(f"More than {max_elements} elements found in one upload.")
+
+
+EXTRACTORS = {
+    'stream': extract_with_stream,
+    'soup': extract_with_soup,
+}
+
+
+def extract_elements(html_content, elements_data=None, mode='stream', max_elements=None):
+    """
+    Append the buttons, standalone anchors and navbar anchors found in
+    html_content to elements_data and return it.
+
+    Raises TooManyElements as soon as more than max_elements are found.
+    """
+    if elements_data is None:
+        elements_data = empty_elements_data()
+    if mode not in EXTRACTORS:
+        raise ValueError(f"Unknown extractor mode: {mode}")
+    return EXTRACTORS[mode](html_content, elements_data, max_elements)
+
+
+@contextmanager
+def open_upload(stream):
+    """
+    Expose an uploaded file as a bytes-like object without copying it.
+
+    In-memory uploads are shared through their buffer. Uploads that were
+    spooled to a temporary file are memory-mapped, so the kernel pages them
+    in as the parser advances instead of reading them into the heap.
+    """
+    if isinstance(stream, io.BytesIO):
+        view = stream.getbuffer()
+        try:
+            yield view
+        finally:
+            view.release()
+        return
+
+    stream.seek(0, os.SEEK_END)
+    if stream.tell() == 0:
+        yield b''
+        return
+    mapped = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield mapped
+    finally:
+        mapped.close()
+
+
+_pool = None
+_pool_size = 0
+_pool_lock = threading.Lock()
+
+
+def get_pool(workers):
+    """
+    Return the shared extraction pool, creating it on first use so that
+    processes are only forked once per worker and reused across requests.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is None or _pool_size != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            _pool_size = workers
+        return _pool
+
+
+def shutdown_pool():
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
+        _pool_size = 0
+
+
+def _extract_one(args):
+    html_content, mode, max_elements = args
+    return extract_elements(html_content, mode=mode, max_elements=max_elements)
+
+
+def merge_elements_data(elements_data, results):
+    """
+    Append per-file results to elements_data in the order they are given,
+    so the merged lists are identical to a sequential run.
+    """
+    for result in results:
+        for category in elements_data:
+            elements_data[category].extend(result[category])
+    return elements_data
+
+
+def extract_each(html_contents, mode='stream', workers=0, min_parallel_bytes=0, cache=None, max_elements=None,
+                 keys=None, previous=None):
+    """
+    Extract elements from several documents and return one elements_data
+    dict per document, in upload order.
+
+    Documents are parsed in a process pool of `workers` processes when there
+    is more than one of them and they add up to at least
+    `min_parallel_bytes`. Smaller uploads are parsed in-process, since
+    shipping them to another process costs more than parsing them.
+
+    When an ExtractionCache is given, documents whose content was seen
+    before are not parsed at all. `keys` may hold their cache keys if the
+    caller already computed them, and `previous` the elements_data of an
+    earlier extraction of each document (or None where there is none),
+    which is used as is.
+    """
+    results = list(previous) if previous is not None else [None] * len(html_contents)
+    if keys is None:
+        keys = [None] * len(html_contents)
+    if cache is not None:
+        for index, html_content in enumerate(html_contents):
+            if results[index] is not None:
+                continue
+            if keys[index] is None:
+                keys[index] = cache.key(html_content, mode)
+            results[index] = cache.get(keys[index])
+
+    from concurrent.futures.process import BrokenProcessPool
+
+    pending = [index for index, result in enumerate(results) if result is None]
+    parsed = None
+    total_bytes = sum(len(html_contents[index]) for index in pending)
+    if workers > 1 and len(pending) > 1 and total_bytes >= min_parallel_bytes:
+        jobs = [(bytes(html_contents[index]), mode, max_elements) for index in pending]
+        try:
+            parsed = list(get_pool(workers).map(_extract_one, jobs))
+        except BrokenProcessPool:
+            # A pool process died, e.g. it was killed for memory. Start a
+            # fresh pool next time and finish this upload in-process.
+            shutdown_pool()
+    if parsed is None:
+        parsed = [extract_elements(html_contents[index], mode=mode, max_elements=max_elements) for index in pending]
+
+    for index, result in zip(pending, parsed):
+        results[index] = result
+        if cache is not None:
+            cache.put(keys[index], result)
+
+    if max_elements is not None and sum(count_elements(result) for result in results) > max_elements:
+        raise TooManyElements(f"More than {max_elements} elements found in one upload.")
+    return results
+
+
+def shared_key(category, element):
+    """The key under which the same element on several pages is shared."""
+    return (category, ' '.join(element['text'].split()).casefold(), element.get('href'))
+
+
+def share_elements(results):
+    """
+    Merge per-document results into one elements_data holding a single copy
+    of every element that repeats across documents, such as the links of a
+    navbar every page includes.
+
+    Elements are shared by shared_key(). The n-th element with a key in one
+    document is shared with the n-th element with that key in the others,
+    so an element that repeats within a page stays distinct. The first
+    occurrence is kept; the other ids it was found under are listed in its
+    'aliases'. Returns (elements_data, pages), where pages holds for every
+    document {category: [positions in elements_data]}.
+    """
+    elements_data = empty_elements_data()
+    positions = {}
+    pages = []
+    for result in results:
+        page = {}
+        occurrences = {}
+        for category, elements in elements_data.items():
+            references = page[category] = []
+            for element in result[category]:
+                key = shared_key(category, element)
+                occurrence = occurrences[key] = occurrences.get(key, -1) + 1
+                position = positions.get((key, occurrence))
+                if position is None:
+                    position = positions[(key, occurrence)] = len(elements)
+                    elements.append(element)
+                else:
+                    shared = elements[position]
+                    if element['id'] != shared['id'] and element['id'] not in shared.get('aliases', ()):
+                        shared = elements[position] = {**shared, 'aliases': shared.get('aliases', []) + [element['id']]}
+                references.append(position)
+        pages.append(page)
+    return elements_data, pages
+
+
+def build_id_index(elements_data, pages):
+    """
+    Build an index from element id, or alias, to its [category, position]
+    in elements_data, as returned by share_elements() with pages.
+
+    An id resolves to the first element found under it: in buttons, then
+    anchors, then nav_anchors. Ids that different elements share are
+    returned as {id: [document positions]}.
+    """
+    documents_of = {}
+    for document, page in enumerate(pages):
+        for category, references in page.items():
+            for position in references:
+                documents = documents_of.setdefault((category, position), [])
+                if not documents or documents[-1] != document:
+                    documents.append(document)
+
+    id_index = {}
+    seen_in = {}
+    for category in ('buttons', 'anchors', 'nav_anchors'):
+        for position, element in enumerate(elements_data[category]):
+            for element_id in [element['id'], *element.get('aliases', ())]:
+                entry = id_index.get(element_id)
+                if entry is None:
+                    id_index[element_id] = [category, position]
+                elif entry != [category, position]:
+                    documents = seen_in.setdefault(element_id, set(documents_of.get(tuple(entry), ())))
+                    documents.update(documents_of.get((category, position), ()))
+
+    duplicate_ids = {
+        element_id: sorted(documents)
+        for element_id, documents in seen_in.items()
+        if len(documents) > 1
+    }
+    return id_index, duplicate_ids
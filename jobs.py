@@ -0,0 +1,86 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import secrets
+import threading
+
+
+class JobError(Exception):
+    """A job failed for a reason its submitter should see, with an HTTP status."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class JobQueue:
+    """
+    Runs slow work, such as parsing a large upload, in a bounded pool of
+    background threads so the request that started it can return at once.
+
+    Every job's status is a dict kept in `store` (see store.py) under its
+    job id, so with a SQLiteStore any worker process can report on a job
+    another one is running. At most `max_jobs` jobs are queued or running
+    in a process at a time.
+    """
+
+    def __init__(self, store, workers=2, max_jobs=16):
+        self.store = store
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self._executor = None
+        self._pid = None
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Threads do not survive a fork, so each worker process starts its own.
+        if self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job')
+            self._pid = os.getpid()
+            self._active = 0
+        return self._executor
+
+    def submit(self, task, *args, status=None):
+        """
+        Run task(progress, *args) in the background and return the new job
+        id, or None if the queue is full. `status` holds the job's initial
+        fields. The task reports progress by calling progress(**fields); the
+        dict it returns is merged into the final status.
+        """
+        with self._lock:
+            executor = self._get_executor()
+            if self._active >= self.max_jobs:
+                return None
+            self._active += 1
+
+        job_id = secrets.token_hex(16)
+        status = {**(status or {}), 'state': 'queued'}
+        self.store.save(status, job_id)
+        executor.submit(self._run, job_id, task, args, status)
+        return job_id
+
+    def _run(self, job_id, task, args, status):
+
+        def progress(**fields):
+            status.update(fields)
+            self.store.save(status, job_id)
+
+        try:
+            progress(state='running')
+            result = task(progress, *args)
+            progress(**(result or {}), state='done')
+        except JobError as e:
+            progress(state='failed', error=str(e), status=e.status)
+        except Exception as e:
+            print(f"Error: {e}")
+            progress(state='failed', error="An error occurred while processing the files.", status=500)
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def status(self, job_id):
+        return self.store.load(job_id)
+
+    def active(self):
+        with self._lock:
+            return self._active
@@ -0,0 +1,433 @@
+from collections import deque
+import json
+import re
+
+RUNTIME_SETUP = """// Initialize Speech Recognition
+const SpeechRecognition = window.SpeechRecognition || window.webkitSpeechRecognition;
+const recognition = new SpeechRecognition();
+
+recognition.continuous = true;
+recognition.lang = 'en-US';
+
+let isStoppedManually = false; // Flag to track manual stop
+
+// Dynamically create the output div
+let output = document.getElementById('output');
+if (!output) {
+    output = document.createElement('div'); // Create the output div if it doesn't exist
+    output.id = 'output';
+    output.textContent = 'Say "add task" to create a to-do.';
+    document.body.appendChild(output); // Append it to the body
+}
+
+// Start speech recognition automatically when the page loads
+window.addEventListener('DOMContentLoaded', () => {
+    recognition.start();
+    output.textContent = 'Voice recognition started automatically!';
+});
+
+recognition.addEventListener('end', () => {
+    if (!isStoppedManually) {
+        recognition.start();
+        output.textContent = 'Voice recognition restarted automatically!';
+    }
+});
+
+document.addEventListener('keydown', (event) => {
+    if (event.key.toLowerCase() === 'v') { 
+        isStoppedManually = false; 
+        recognition.start();
+        output.textContent = 'Voice recognition started!';
+    }
+});
+
+document.addEventListener('keydown', (event) => {
+    if (event.key.toLowerCase() === 'q') { 
+        isStoppedManually = true; 
+        recognition.stop();
+        output.textContent = 'Voice recognition stopped!';
+    }
+});
+
+"""
+
+# Bump when the shape of the command table changes. A runtime only loads
+# tables of its own version.
+RUNTIME_VERSION = 2
+
+TABLE_LOADER = """// Voice commands, in the order they are checked. They are filled in by
+// loadCommands(), either inline at the end of a standalone script or, when
+// the runtime is included with a data-commands attribute, from that JSON
+// file once the page has loaded.
+const RUNTIME_VERSION = %d;
+let COMMANDS = [];
+let MATCHER = { next: [{}], fail: [0], out: {} };
+let FUZZY = { rules: [], words: 0, min: 0, keys: {}, deletes: {} };
+let SOUND_RULES = [];
+
+function loadCommands(table) {
+    if (table.version !== RUNTIME_VERSION) {
+        console.error(`Command table version ${table.version} does not match runtime version ${RUNTIME_VERSION}`);
+        return;
+    }
+    COMMANDS = table.commands;
+    MATCHER = table.matcher;
+    FUZZY = table.fuzzy;
+    SOUND_RULES = FUZZY.rules.map(([pattern, replacement]) => [new RegExp(pattern, 'g'), replacement]);
+}
+
+const commandsUrl = document.currentScript?.dataset.commands;
+if (commandsUrl) {
+    const fetchCommands = () => fetch(commandsUrl)
+        .then((response) => response.json())
+        .then(loadCommands)
+        .catch((error) => console.error('Error:', error));
+    if (document.readyState === 'loading') {
+        window.addEventListener('DOMContentLoaded', fetchCommands);
+    } else {
+        fetchCommands();
+    }
+}
+
+""" % RUNTIME_VERSION
+
+DISPATCHER = """// Find every command whose phrase occurs in the transcript with one pass of
+// an Aho-Corasick automaton, and return their indexes in command order.
+function matchCommands(transcript) {
+    const matched = new Set(MATCHER.out[0] || []);
+    let state = 0;
+    for (const ch of transcript) {
+        while (state && !(ch in MATCHER.next[state])) {
+            state = MATCHER.fail[state];
+        }
+        state = MATCHER.next[state][ch] || 0;
+        (MATCHER.out[state] || []).forEach((index) => matched.add(index));
+    }
+    return Array.from(matched).sort((a, b) => a - b);
+}
+
+// When no phrase occurs verbatim, compare the sound keys of every run of up
+// to FUZZY.words words with the precomputed keys of the phrases, allowing
+// one edit away from the first and last sound. Keys shorter than FUZZY.min
+// are skipped. The cost depends on the transcript, not on the number of
+// commands.
+function soundKey(text) {
+    for (const [pattern, replacement] of SOUND_RULES) {
+        text = text.replace(pattern, replacement);
+    }
+    let key = '';
+    for (const ch of text) {
+        if (ch !== key[key.length - 1]) {
+            key += ch;
+        }
+    }
+    return key.length > 2 && key.endsWith('a') ? key.slice(0, -1) : key;
+}
+
+function fuzzyCommands(transcript) {
+    const words = transcript.split(new RegExp('[^a-z0-9]+')).filter(Boolean);
+    const exact = new Set();
+    const close = new Set();
+    const add = (found, indexes) => (indexes || []).forEach((index) => found.add(index));
+    for (let start = 0; start < words.length; start++) {
+        for (let end = start + 1; end <= Math.min(words.length, start + FUZZY.words); end++) {
+            const key = soundKey(words.slice(start, end).join(''));
+            if (key.length < FUZZY.min) {
+                continue;
+            }
+            add(exact, FUZZY.keys[key]);
+            if (exact.size) {
+                continue;
+            }
+            add(close, FUZZY.deletes[key]);
+            for (let position = 1; position < key.length - 1; position++) {
+                const variant = key.slice(0, position) + key.slice(position + 1);
+                add(close, FUZZY.keys[variant]);
+                add(close, FUZZY.deletes[variant]);
+            }
+        }
+    }
+    return Array.from(exact.size ? exact : close).sort((a, b) => a - b);
+}
+
+function runCommand(command) {
+    switch (command.type) {
+        case 'scroll':
+            window.scrollBy(0, command.by);
+            break;
+        case 'back':
+            window.history.back();
+            break;
+        case 'click': {
+            // A component shared by several pages may have another id on this one.
+            const element = [command.id, ...(command.aliases || [])]
+                .map((id) => document.getElementById(id))
+                .find(Boolean);
+            if (!element) {
+                output.textContent += command.missing;
+                return;
+            }
+            element.click();
+            break;
+        }
+        case 'section':
+            scrollToSection(command.section);
+            break;
+    }
+    output.textContent += command.message;
+}
+
+""" + """recognition.addEventListener('result', (event) => {
+    const transcript = event.results[event.resultIndex][0].transcript.toLowerCase();
+    output.textContent = transcript;
+
+    let matched = matchCommands(transcript);
+    if (!matched.length) {
+        matched = fuzzyCommands(transcript);
+    }
+    matched.forEach((index) => runCommand(COMMANDS[index]));
+});
+""" + """// Error handling for speech recognition
+recognition.addEventListener('error', (event) => {
+    console.error('Error:', event.error);
+    output.textContent = `Error: ${event.error}`;
+});
+
+// Function to smoothly scroll to a specific section
+function scrollToSection(sectionId) {
+    document.getElementById(sectionId)?.scrollIntoView({ behavior: 'smooth' });
+}
+
+// Ensure 'Let's Connect' button scrolls to section
+document.getElementById('connect')?.addEventListener('click', () => scrollToSection("let us connect"));
+"""
+
+# Commands every script understands, checked before the selected components.
+FIXED_COMMANDS = [
+    ('scroll up', {'type': 'scroll', 'by': -500, 'message': ' - Scrolled up!'}),
+    ('scroll down', {'type': 'scroll', 'by': 500, 'message': ' - Scrolled down!'}),
+    ('go back', {'type': 'back', 'message': ' - Navigated back!'}),
+]
+
+
+# Rewrites that give words which sound alike the same key, applied in order
+# to the lower-cased words of a phrase joined without spaces. The patterns
+# are shared with the browser, so they only use syntax that Python and
+# JavaScript regular expressions agree on.
+SOUND_RULES = [
+    ('x', 'ks'),
+    ('^kn', 'n'),
+    ('^wr', 'r'),
+    ('^ps', 's'),
+    ('ph', 'f'),
+    ('gh', ''),
+    ('ck', 'k'),
+    ('tch', 'X'),
+    ('sch', 'sk'),
+    ('ch', 'X'),
+    ('sh', 'X'),
+    ('th', 'T'),
+    ('qu', 'kw'),
+    ('dg', 'j'),
+    ('c(?=[eiy])', 's'),
+    ('c', 'k'),
+    ('q', 'k'),
+    ('z', 's'),
+    ('[aeiouy]+', 'a'),
+    ('(?!^)h', ''),
+    ('w(?!a)', ''),
+]
+COMPILED_SOUND_RULES = [(re.compile(pattern), replacement) for pattern, replacement in SOUND_RULES]
+WORD_SEPARATOR = re.compile('[^a-z0-9]+')
+# Phrases with keys shorter than this are only matched verbatim. Short words
+# share keys too readily: "him", "ham" and "home" all sound like "Home".
+FUZZY_MIN_LENGTH = 5
+
+
+def js_literal(value):
+    """
+    Serialize value as a compact JavaScript literal that is also safe to
+    paste inside an inline <script> tag.
+    """
+    return json.dumps(value, separators=(',', ':')).replace('<', '\\u003c')
+
+
+def build_commands(selected_components):
+    """
+    Return the phrases to listen for and the command each one triggers.
+    A command fires when its phrase is a substring of the transcript.
+    """
+    phrases = [phrase for phrase, _ in FIXED_COMMANDS]
+    commands = [command for _, command in FIXED_COMMANDS]
+
+    for component in selected_components:
+        component_id = component['id']
+        name = component['name']
+        tag = component.get('tag')
+
+        if tag == 'button':
+            phrases.append(name.lower())
+            commands.append({
+                'type': 'click',
+                'id': component_id,
+                'message': f" - {name} button clicked!",
+                'missing': f" - {name} button not found!"
+            })
+            if component.get('aliases'):
+                commands[-1]['aliases'] = component['aliases']
+
+        elif tag == 'a':
+            phrases.append(name.lower())
+            commands.append({
+                'type': 'click',
+                'id': component_id,
+                'message': f" - Navigating to {name}!",
+                'missing': f" - {name} anchor not found!"
+            })
+            if component.get('aliases'):
+                commands[-1]['aliases'] = component['aliases']
+
+        elif tag == 'nav-a':
+            href = component.get('href')
+            if href:  # Check if href is not None or empty
+                href = href.replace('#', '')  # Remove the '#' from href if present
+            else:
+                href = ''  # Set it to an empty string if href is None
+            phrases.append(f"go to {name.lower()}")
+            commands.append({
+                'type': 'section',
+                'section': href,
+                'message': f" - Scrolled to {name.lower()}!"
+            })
+
+    return phrases, commands
+
+
+def build_matcher(phrases):
+    """
+    Build an Aho-Corasick automaton over phrases.
+
+    Returns {'next': [...], 'fail': [...], 'out': {...}}: the goto table as one
+    {character: state} dict per state, the failure link of every state, and
+    for each state that ends a phrase the indexes of all phrases ending there.
+    """
+    next_states = [{}]
+    outputs = [[]]
+    for index, phrase in enumerate(phrases):
+        state = 0
+        for ch in phrase:
+            following = next_states[state].get(ch)
+            if following is None:
+                following = len(next_states)
+                next_states[state][ch] = following
+                next_states.append({})
+                outputs.append([])
+            state = following
+        outputs[state].append(index)
+
+    fail = [0] * len(next_states)
+    queue = deque(next_states[0].values())
+    while queue:
+        state = queue.popleft()
+        for ch, following in next_states[state].items():
+            queue.append(following)
+            fallback = fail[state]
+            while fallback and ch not in next_states[fallback]:
+                fallback = fail[fallback]
+            fail[following] = next_states[fallback].get(ch, 0)
+            # The root's outputs are empty phrases, which the dispatcher adds
+            # up front, so they are not copied into every state.
+            if fail[following]:
+                outputs[following].extend(outputs[fail[following]])
+
+    return {
+        'next': next_states,
+        'fail': fail,
+        'out': {state: sorted(found) for state, found in enumerate(outputs) if found},
+    }
+
+
+def sound_key(text):
+    """
+    Return the key that speech-recognition variants of text should share:
+    "log in" and "login", or "write" and "right", get the same key.
+    """
+    text = ''.join(WORD_SEPARATOR.split(text.lower()))
+    for pattern, replacement in COMPILED_SOUND_RULES:
+        text = pattern.sub(replacement, text)
+    key = ''
+    for ch in text:
+        if not key or ch != key[-1]:
+            key += ch
+    return key[:-1] if len(key) > 2 and key.endswith('a') else key
+
+
+def build_fuzzy_index(phrases):
+    """
+    Build the table fuzzyCommands() looks transcripts up in: the sound key
+    of every phrase long enough for fuzzy matching, and the keys one deletion
+    away from it, each mapped to phrase indexes.
+
+    The first and last sounds are never deleted. Phrases that start alike,
+    such as "sign in" and "sign up", often differ in their last sound only,
+    and one edit there would turn one into the other.
+    """
+    keys = {}
+    deletes = {}
+    longest = 1
+    for index, phrase in enumerate(phrases):
+        words = [word for word in WORD_SEPARATOR.split(phrase.lower()) if word]
+        key = sound_key(phrase)
+        if len(key) < FUZZY_MIN_LENGTH:
+            continue
+        longest = max(longest, len(words))
+        keys.setdefault(key, []).append(index)
+        for position in range(1, len(key) - 1):
+            variant = key[:position] + key[position + 1:]
+            found = deletes.setdefault(variant, [])
+            if index not in found:
+                found.append(index)
+
+    return {
+        'rules': SOUND_RULES,
+        # One more word than the longest phrase, for words the recognizer splits.
+        'words': longest + 1,
+        'min': FUZZY_MIN_LENGTH,
+        'keys': keys,
+        'deletes': deletes,
+    }
+
+
+RUNTIME = RUNTIME_SETUP + TABLE_LOADER + DISPATCHER
+
+
+def build_command_table(selected_components):
+    """
+    Return everything the runtime needs to know about the selected
+    components: the commands, the phrase matcher and the fuzzy index.
+    """
+    phrases, commands = build_commands(selected_components)
+    return {
+        'version': RUNTIME_VERSION,
+        'commands': commands,
+        'matcher': build_matcher(phrases),
+        'fuzzy': build_fuzzy_index(phrases),
+    }
+
+
+def generate_command_table(selected_components):
+    """Return the command table as compact JSON for the runtime to fetch."""
+    return js_literal(build_command_table(selected_components))
+
+
+def embed_command_table(command_table):
+    """Return the runtime with a table from generate_command_table inlined."""
+    return RUNTIME + f"loadCommands({command_table});\n"
+
+
+def generate_js_code(selected_components):
+    """
+    Generate JavaScript code based on the selected components: the runtime
+    with the command table inlined, as one standalone script.
+    """
+    return embed_command_table(generate_command_table(selected_components))
@@ -0,0 +1,101 @@
+from contextlib import contextmanager, nullcontext
+import threading
+import time
+
+from flask import g, has_request_context
+
+# Upper bounds, in seconds, of the stage duration histogram buckets.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+COUNTERS = {
+    'files': 'HTML files extracted.',
+    'bytes': 'Bytes of HTML extracted.',
+    'elements': 'Buttons and anchors extracted.',
+}
+
+NULL_STAGE = nullcontext()
+
+
+class Metrics:
+    """
+    Per-stage timers and upload counters for one worker process.
+
+    Each stage's durations go into a histogram exported in the Prometheus
+    text format by render(). Stages timed while handling a request are also
+    kept on flask.g for the Server-Timing header. When disabled, stage()
+    returns a shared no-op context manager and count() returns at once.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = dict.fromkeys(COUNTERS, 0)
+
+    def stage(self, name):
+        if not self.enabled:
+            return NULL_STAGE
+        return self._time(name)
+
+    @contextmanager
+    def _time(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0}
+            for position, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram['buckets'][position] += 1
+                    break
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+        if has_request_context():
+            g.setdefault('stage_timings', []).append((name, seconds))
+
+    def count(self, **amounts):
+        if not self.enabled:
+            return
+        with self._lock:
+            for name, amount in amounts.items():
+                self._counters[name] += amount
+
+    def server_timing(self):
+        """
+        Return the Server-Timing header value for the current request, or
+        None. A stage timed more than once, such as reading the members of
+        an archive, is reported once with its total duration.
+        """
+        timings = g.get('stage_timings')
+        if not timings:
+            return None
+        totals = {}
+        for name, seconds in timings:
+            totals[name] = totals.get(name, 0.0) + seconds
+        return ', '.join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in totals.items())
+
+    def render(self):
+        lines = [
+            '# HELP intellinet_stage_seconds Time spent in each stage of handling an upload or generation.',
+            '# TYPE intellinet_stage_seconds histogram',
+        ]
+        with self._lock:
+            for name, histogram in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, observed in zip(BUCKETS, histogram['buckets']):
+                    cumulative += observed
+                    lines.append(f'intellinet_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'intellinet_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {histogram["count"]}')
+                lines.append(f'intellinet_stage_seconds_sum{{stage="{name}"}} {histogram["sum"]}')
+                lines.append(f'intellinet_stage_seconds_count{{stage="{name}"}} {histogram["count"]}')
+            for name, description in COUNTERS.items():
+                lines.append(f'# HELP intellinet_{name}_total {description}')
+                lines.append(f'# TYPE intellinet_{name}_total counter')
+                lines.append(f'intellinet_{name}_total {self._counters[name]}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,125 @@
+import cProfile
+import io
+import os
+import pstats
+import re
+import secrets
+import threading
+import time
+import tracemalloc
+
+# Functions listed by cumulative time, and allocation sites by size, in a
+# profile's text report.
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+
+
+class Profiler:
+    """
+    Runs single requests under cProfile and tracemalloc and keeps what they
+    found in a directory: for each request, NAME.prof with the raw stats,
+    for pstats or snakeviz, and NAME.txt with the slowest functions and
+    the largest allocation sites. Only the newest `max_profiles` are kept.
+
+    tracemalloc is process-wide, so one request is profiled at a time;
+    requests that arrive meanwhile run as usual.
+    """
+
+    NAME = re.compile(r'^[0-9]{8}-[0-9]{6}-[A-Z]+-[\w-]{0,40}-[0-9a-f]{6}\.(prof|txt)$')
+
+    def __init__(self, directory, max_profiles=50, frames=10):
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self.frames = frames
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self):
+        """
+        Start profiling the calling thread. Returns a handle for stop(), or
+        None if another request is being profiled.
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start(self.frames)
+        tracemalloc.reset_peak()
+        profile = cProfile.Profile()
+        started = time.perf_counter()
+        profile.enable()
+        return profile, started, was_tracing
+
+    def stop(self, handle, method, path, error=None):
+        """Stop a profile from start() and save it. Returns its name."""
+        profile, started, was_tracing = handle
+        try:
+            profile.disable()
+            seconds = time.perf_counter() - started
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            if not was_tracing:
+                tracemalloc.stop()
+            return self._save(profile, snapshot, seconds, current, peak, method, path, error)
+        finally:
+            self._lock.release()
+
+    def _save(self, profile, snapshot, seconds, current, peak, method, path, error):
+        slug = re.sub(r'[^\w-]+', '-', path).strip('-')[:40]
+        stem = f"{time.strftime('%Y%m%d-%H%M%S')}-{method}-{slug}-{secrets.token_hex(3)}"
+        profile.dump_stats(os.path.join(self.directory, f"{stem}.prof"))
+
+        report = io.StringIO()
+        report.write(f"{method} {path}" + (f" failed: {error!r}\n" if error is not None else "\n"))
+        report.write(f"{seconds * 1000:.1f} ms, peak traced memory {peak / 1024:.0f} KiB, "
+                     f"still allocated at the end {current / 1024:.0f} KiB\n")
+        report.write("Allocations are traced process-wide, so other threads' show up too.\n\n")
+        stats = pstats.Stats(profile, stream=report)
+        stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+
+        report.write(f"Top {TOP_ALLOCATIONS} allocation sites still alive at the end of the request:\n")
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<unknown>'),
+        ])
+        for statistic in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+            report.write(f"  {statistic}\n")
+        with open(os.path.join(self.directory, f"{stem}.txt"), 'w', encoding='utf-8') as report_file:
+            report_file.write(report.getvalue())
+
+        self.prune()
+        return stem
+
+    def list(self):
+        """Return the saved profiles' files, newest first."""
+        profiles = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if self.NAME.match(entry.name):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    profiles.append({'name': entry.name, 'size': stat.st_size, 'modified': stat.st_mtime})
+        profiles.sort(key=lambda profile: (profile['modified'], profile['name']), reverse=True)
+        return profiles
+
+    def path(self, name):
+        """Return the path of a saved profile file, or None if name is not one."""
+        if not self.NAME.match(name):
+            return None
+        return os.path.join(self.directory, name)
+
+    def prune(self):
+        stems = []
+        for profile in self.list():
+            stem = profile['name'].rsplit('.', 1)[0]
+            if stem not in stems:
+                stems.append(stem)
+        for stem in stems[self.max_profiles:]:
+            for extension in ('.prof', '.txt'):
+                try:
+                    os.remove(os.path.join(self.directory, stem + extension))
+                except FileNotFoundError:
+                    pass
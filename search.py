@@ -0,0 +1,78 @@
+from bisect import bisect_right
+
+CATEGORIES = ('buttons', 'anchors', 'nav_anchors')
+
+
+class ElementIndex:
+    """
+    Substring search over the ids, texts and hrefs of one upload's elements.
+
+    Each category's elements are lower-cased into one row per element and
+    the rows joined into a single string, so a query is a handful of
+    str.find calls instead of a Python-level scan of every element. A query
+    that extends the previous one only looks at the previous matches.
+    """
+
+    def __init__(self, elements_data):
+        self.elements_data = elements_data
+        self._rows = {}
+        self._starts = {}
+        self._blobs = {}
+        self._last = (None, None, None)
+        for category in CATEGORIES:
+            # Fields are normalized one by one: \x1f counts as whitespace, so
+            # normalizing the joined row would turn the separators into spaces
+            # and let a query match across fields.
+            rows = [
+                '\x1f'.join(self.normalize(field) for field in (element['id'], element['text'], element.get('href') or ''))
+                for element in elements_data[category]
+            ]
+            starts = []
+            offset = 0
+            for row in rows:
+                starts.append(offset)
+                offset += len(row) + 1
+            self._rows[category] = rows
+            self._starts[category] = starts
+            self._blobs[category] = '\n'.join(rows)
+
+    @staticmethod
+    def normalize(text):
+        return ' '.join(text.lower().split())
+
+    def search(self, query='', category=None):
+        """
+        Return the [category, position] of every element whose id, text or
+        href contains query, in the order the selection page lists them.
+        """
+        query = self.normalize(query)
+        categories = [category] if category else CATEGORIES
+
+        last_query, last_category, last_matches = self._last
+        if last_query and category == last_category and query.startswith(last_query):
+            matches = [
+                match for match in last_matches
+                if query in self._rows[match[0]][match[1]]
+            ]
+        else:
+            matches = []
+            for name in categories:
+                matches.extend([name, position] for position in self._find(name, query))
+        self._last = (query, category, matches)
+        return matches
+
+    def _find(self, category, query):
+        if not query:
+            return range(len(self._rows[category]))
+        blob = self._blobs[category]
+        starts = self._starts[category]
+        positions = []
+        found = blob.find(query)
+        while found != -1:
+            row = bisect_right(starts, found) - 1
+            positions.append(row)
+            # Continue from the next row; one match per element is enough.
+            if row + 1 >= len(starts):
+                break
+            found = blob.find(query, starts[row + 1])
+        return positions
@@ -0,0 +1,253 @@
+from collections import OrderedDict
+import json
+import os
+import re
+import secrets
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+
+def new_key():
+    return secrets.token_urlsafe(24)
+
+
+class MemoryStore:
+    """
+    Server-side store kept in the memory of one process. Only suitable when
+    the app runs a single worker; use SQLiteStore under gunicorn.
+    """
+
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def save(self, data, key=None):
+        key = key or new_key()
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + self.ttl, data)
+            self._purge_expired()
+        return key
+
+    def load(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, data = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            return data
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _purge_expired(self):
+        # Entries share one TTL, so insertion order is expiry order.
+        now = time.time()
+        while self._entries:
+            key, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at >= now:
+                break
+            del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteStore:
+    """
+    Server-side store backed by a SQLite file, shared by every worker
+    process that points at the same path. Values are stored as compact JSON.
+    """
+
+    PURGE_INTERVAL = 60
+
+    def __init__(self, path, ttl=3600):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._last_purge = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        connection = sqlite3.connect(path, timeout=30)
+        try:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'key TEXT PRIMARY KEY, expires_at REAL NOT NULL, data TEXT NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS entries_expires_at ON entries (expires_at)')
+            connection.commit()
+        finally:
+            connection.close()
+
+    def _connection(self):
+        # Connections are per thread and are never reused across a fork.
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.connection = sqlite3.connect(self.path, timeout=30)
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def save(self, data, key=None):
+        key = key or new_key()
+        payload = json.dumps(data, separators=(',', ':'))
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO entries (key, expires_at, data) VALUES (?, ?, ?)',
+                (key, time.time() + self.ttl, payload)
+            )
+        self._purge_expired()
+        return key
+
+    def load(self, key):
+        row = self._connection().execute(
+            'SELECT data FROM entries WHERE key = ? AND expires_at >= ?', (key, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def delete(self, key):
+        connection = self._connection()
+        with connection:
+            connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+
+    def _purge_expired(self):
+        now = time.time()
+        if now - self._last_purge < self.PURGE_INTERVAL:
+            return
+        self._last_purge = now
+        connection = self._connection()
+        with connection:
+            connection.execute('DELETE FROM entries WHERE expires_at < ?', (now,))
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+
+def create_store(backend, path=None, ttl=3600):
+    if backend == 'memory':
+        return MemoryStore(ttl)
+    if backend == 'sqlite':
+        return SQLiteStore(path, ttl)
+    raise ValueError(f"Unknown store backend: {backend}")
+
+
+def write_atomic(path, data):
+    """
+    Write data, bytes or text to be stored as UTF-8, to path through a
+    temporary file in the same directory that is renamed into place, so
+    readers only ever see complete files.
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def load_secret_key(path):
+    """
+    Return the secret key stored at path, creating it if needed. The key is
+    written to a temporary file and hard-linked into place, so concurrently
+    starting workers all end up with the same key.
+    """
+    try:
+        with open(path, 'rb') as key_file:
+            return key_file.read()
+    except FileNotFoundError:
+        pass
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            temp_file.write(os.urandom(32))
+        try:
+            os.link(temp_path, path)
+        except FileExistsError:
+            pass
+    finally:
+        os.remove(temp_path)
+
+    with open(path, 'rb') as key_file:
+        return key_file.read()
+
+
+class ArtifactStore:
+    """
+    Keeps the files produced by each /generate call under their own job
+    directory, so concurrent users never overwrite each other's output.
+
+    Files are written to a temporary file and renamed into place. Jobs older
+    than `ttl` seconds are removed, and only the newest `max_jobs` are kept.
+    """
+
+    NAMES = frozenset(['manifest.json', 'generated_code.js'])
+    JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+    PRUNE_INTERVAL = 60
+
+    def __init__(self, directory, ttl=24 * 3600, max_jobs=1000):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self._last_prune = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def create_job(self):
+        job_id = secrets.token_hex(16)
+        os.makedirs(os.path.join(self.directory, job_id))
+        self.prune()
+        return job_id
+
+    def path(self, job_id, name):
+        """
+        Return the path of an artifact, or None if job_id or name is not one
+        this store could have produced.
+        """
+        if not self.JOB_ID.match(job_id) or name not in self.NAMES:
+            return None
+        return os.path.join(self.directory, job_id, name)
+
+    def write(self, job_id, name, data):
+        path = self.path(job_id, name)
+        if path is None:
+            raise ValueError(f"Invalid artifact: {job_id}/{name}")
+        write_atomic(path, data)
+        return path
+
+    def prune(self, force=False):
+        now = time.time()
+        if not force and now - self._last_prune < self.PRUNE_INTERVAL:
+            return
+        self._last_prune = now
+
+        jobs = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_dir() and self.JOB_ID.match(entry.name):
+                    try:
+                        jobs.append((entry.stat().st_mtime, entry.path))
+                    except FileNotFoundError:
+                        continue
+        jobs.sort(reverse=True)
+
+        for position, (modified_at, job_path) in enumerate(jobs):
+            if position >= self.max_jobs or modified_at < now - self.ttl:
+                shutil.rmtree(job_path, ignore_errors=True)
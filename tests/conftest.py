@@ -0,0 +1,34 @@
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The app reads its settings when it is imported, so everything it writes is
+# pointed at a scratch directory before any test imports it.
+INSTANCE = tempfile.mkdtemp(prefix='intellinet-tests-')
+atexit.register(shutil.rmtree, INSTANCE, ignore_errors=True)
+os.environ.update({
+    'INTELLINET_SECRET_KEY': 'tests',
+    'INTELLINET_SESSION_BACKEND': 'memory',
+    'INTELLINET_SITE_BACKEND': 'memory',
+    'INTELLINET_JOB_DB': os.path.join(INSTANCE, 'jobs.sqlite3'),
+    'INTELLINET_ARTIFACT_DIR': os.path.join(INSTANCE, 'artifacts'),
+    'INTELLINET_BUNDLE_DIR': os.path.join(INSTANCE, 'bundles'),
+    'INTELLINET_UPLOAD_DIR': os.path.join(INSTANCE, 'uploads'),
+    'INTELLINET_TEMPLATE_CACHE_DIR': os.path.join(INSTANCE, 'jinja_cache'),
+    'INTELLINET_EXTRACT_SLOT_DIR': os.path.join(INSTANCE, 'extract_slots'),
+    'INTELLINET_EXTRACTION_CACHE_BYTES': '0',
+})
+
+
+@pytest.fixture
+def client():
+    from app import app
+    with app.test_client() as client:
+        yield client
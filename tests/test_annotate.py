@@ -0,0 +1,92 @@
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+import annotate as annotate_module
+import extractor
+from annotate import annotate, stream_annotated
+from extractor import extract_elements
+
+BeautifulSoup = pytest.importorskip('bs4').BeautifulSoup
+
+
+def tar_gz(members):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+SITE_TGZ = tar_gz([('index.html', b'<button>Go</button>' * 200)])
+
+
+@pytest.mark.parametrize('filename, data', [
+    ('site.tgz', b'this is not an archive'),
+    ('site.tar.gz', SITE_TGZ[:12]),
+    ('site.tgz', SITE_TGZ[:len(SITE_TGZ) // 2]),
+    ('site.zip', b'this is not an archive'),
+], ids=['garbage-tgz', 'truncated-header-tgz', 'truncated-tgz', 'garbage-zip'])
+def test_broken_archive_is_refused_before_streaming(client, filename, data):
+    response = client.post('/annotate', data={'file': (io.BytesIO(data), filename)},
+                           content_type='multipart/form-data')
+    assert response.status_code == 400
+    assert b'is not a valid archive' in response.data
+
+
+PAGES = {
+    'utf-8': ('utf-8', '<html><body><nav><a href="#top">Top</a></nav>'
+                       '<BUTTON class=x>Café</BUTTON><a href="/menü" id="kept">Menü</a>'
+                       '<a href=/bare>Bare</a><a href="/self"/><button\ttype=submit>Go</button>'
+                       '<script>"<button>no</button>"</script></body></html>'),
+    'utf-8-bom': ('utf-8', '\ufeff<button>€ price</button><a href="/x">x</a>'),
+    'utf-16le-bom': ('utf-16le', '\ufeff<nav><a href="#日">日本</a></nav><button>語</button>'),
+    'windows-1252': ('windows-1252', '<meta charset="windows-1252"><button>déjà vu</button><a href="/ü">über</a>'),
+}
+
+
+def derived_ids(html_content):
+    return [
+        element['id'] for elements in extract_elements(html_content).values() for element in elements
+        if element['id'].startswith(('btn-', 'a-', 'nav-a-'))
+    ]
+
+
+@pytest.mark.parametrize('chunk_size', [7, 64, extractor.CHUNK_SIZE])
+@pytest.mark.parametrize('piece_size', [3, annotate_module.PIECE_SIZE])
+@pytest.mark.parametrize('name', PAGES)
+def test_annotated_page_round_trips(monkeypatch, name, chunk_size, piece_size):
+    monkeypatch.setattr(extractor, 'CHUNK_SIZE', chunk_size)
+    monkeypatch.setattr(annotate_module, 'PIECE_SIZE', piece_size)
+    encoding, text = PAGES[name]
+    html_content = text.encode(encoding)
+    annotated = b''.join(annotate(html_content))
+
+    # Every element without an id now carries the one extraction gave it...
+    ids = derived_ids(html_content)
+    assert ids
+    soup = BeautifulSoup(annotated, 'html.parser')
+    for tag in soup.find_all('button') + soup.find_all('a', href=True):
+        assert tag.get('id') is not None
+    assert extract_elements(annotated, mode='soup') == extract_elements(html_content, mode='soup')
+
+    # ...right after its tag name, and every other byte is the original's.
+    stripped = annotated
+    for element_id in ids:
+        attribute = f' id="{element_id}"'.encode(encoding)
+        before = stripped[:stripped.index(attribute)].decode(encoding).lower()
+        assert before.endswith('<button' if element_id.startswith('btn-') else '<a')
+        stripped = stripped.replace(attribute, b'', 1)
+    assert stripped == html_content
+
+
+def test_zip_holds_the_annotated_pages():
+    pages = [(f'{name}.html', PAGES[name][1].encode(PAGES[name][0])) for name in PAGES]
+    archive = zipfile.ZipFile(io.BytesIO(b''.join(stream_annotated(pages))))
+    assert archive.namelist() == [filename for filename, _ in pages]
+    for filename, html_content in pages:
+        assert archive.read(filename) == b''.join(annotate(html_content))
@@ -0,0 +1,25 @@
+import pytest
+
+
+def test_generate(client):
+    component = {'id': 'btn-1', 'name': 'Save', 'tag': 'button', 'text': 'Save', 'aliases': ['btn-2']}
+    response = client.post('/api/v1/generate', json={'components': [component]})
+    assert response.status_code == 200
+    assert response.json['manifest'] == [component]
+    assert 'btn-2' in response.json['js_code']
+
+
+@pytest.mark.parametrize('fields', [
+    {'href': 123},
+    {'href': {}},
+    {'tag': ['a']},
+    {'text': 1.5},
+    {'aliases': 'btn-2'},
+    {'aliases': ['btn-2', 3]},
+])
+def test_generate_rejects_malformed_optional_fields(client, fields):
+    component = {'id': 'a-1', 'name': 'Home', 'tag': 'nav-a', **fields}
+    response = client.post('/api/v1/generate', json={'components': [component]})
+    assert response.status_code == 400
+    assert response.is_json
+    assert 'error' in response.json
@@ -0,0 +1,49 @@
+import os
+import sys
+
+import pytest
+
+import extractor
+from extractor import extract_elements
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+from corpus import DEFAULTS, generate_page  # noqa: E402
+
+pytest.importorskip('bs4')
+# The xml-declaration case is parsed as HTML on purpose.
+pytestmark = pytest.mark.filterwarnings('ignore::bs4.XMLParsedAsHTMLWarning')
+
+CASES = {
+    'flat': b'<button>Go</button><a href="/about">About</a><nav><a href="#top">Top</a></nav>',
+    'nested-navs': b'<nav><div><a href="#a">A</a><nav><a href="#b">B</a></nav></div></nav><a href="#c">C</a>',
+    'anchor-in-button': b'<button>Buy <a href="/cart">cart</a> now</button>',
+    'button-in-nav': b'<nav><button id="menu">Menu</button><a href="/x">X</a></nav>',
+    'unclosed': b'<div><button>One<button>Two</div><a href="/y">Y<p>para',
+    'stray-end-tags': b'</a></nav><button>Ok</button></button></div><a href=/z>Z</a>',
+    'upper-case': b'<NAV><A HREF="#Up">UP</A></NAV><BUTTON TYPE=submit>SEND</BUTTON>',
+    'entities': b'<button>Fish &amp; chips&nbsp;&#x27;n&#39; &copy;&bogus; &amp</button>'
+                b'<a href="/q?a=1&amp;b=2&c=3">Q&lt;1&gt;</a>',
+    'whitespace': b'<button>\n  Two\t words \n</button><pre><a href="#p">  keep\n spaces </a></pre>',
+    'raw-text': b'<script>var s = "<button>no</button>";</script><style>a{}</style>'
+                b'<textarea><a href="#t">no</a></textarea><button>yes</button>',
+    'comments': b'<!-- <button>no</button> --><button>yes<!-- inner --></button><![CDATA[x]]>',
+    'empty-and-self-closing': b'<button/><a href="/e"/><a></a><button></button>',
+    'repeated': b'<button>Same</button>' * 5 + b'<a href="/s">Same</a>' * 3,
+    'meta-charset': b'<meta charset="windows-1252"><button>caf\xe9</button><a href="/\xfc">\xfc</a>',
+    'http-equiv': b'<meta http-equiv="Content-Type" content="text/html; charset=iso-8859-2">'
+                  b'<button>\xb1\xe6</button>',
+    'xml-declaration': b'<?xml version="1.0" encoding="iso-8859-1"?><button>\xe0 la carte</button>',
+    'utf-8-bom': '\ufeff<button>café €</button>'.encode('utf-8'),
+    'utf-16-bom': '\ufeff<button>日本</button><a href="/j">語</a>'.encode('utf-16'),
+    'invalid-utf-8': b'<button>bad \xff\xfe bytes \xc3</button><a href="/b">ok</a>',
+}
+for seed in range(3):
+    CASES[f'corpus-{seed}'] = generate_page(64 * 1024, seed=seed, **DEFAULTS)
+
+
+@pytest.mark.parametrize('chunk_size', [7, extractor.CHUNK_SIZE])
+@pytest.mark.parametrize('name', CASES)
+def test_stream_matches_soup(monkeypatch, name, chunk_size):
+    monkeypatch.setattr(extractor, 'CHUNK_SIZE', chunk_size)
+    html_content = CASES[name]
+    assert extract_elements(html_content, mode='stream') == extract_elements(html_content, mode='soup')